@@ -9,42 +9,171 @@ bl_info = {
 }
         
 
-import bpy
 import os
-import re
-import colorsys
+import sys
+import bpy
 from . import wallpaper
 from . import colorz
+from . import profiling
+from . import template
+from . import pipeline
+from . import watch
 from bpy.types import Panel, Operator
 
 def init_properties():
     bpy.types.Scene.axis_shift = bpy.props.BoolProperty(
         name='Apply to Axis/Grid',
-        default=True
+        default=True,
+        update=pipeline.refresh
     )
     bpy.types.Scene.rand_shift = bpy.props.BoolProperty(
         name='Random/Unseeded Theme',
         default=False
     )
+    bpy.types.Scene.quantizer_shift = bpy.props.EnumProperty(
+        name='Quantizer',
+        items=[
+            ('KMEANS', 'K-mean', 'Iterative k-mean (best colors, slowest)'),
+            ('MEDIAN_CUT', 'Median Cut', 'Split the colors at their weighted median in one pass'),
+            ('OCTREE', 'Octree', 'Merge an RGB octree down to the palette size in one pass'),
+        ],
+        default=colorz.DEFAULT_QUANTIZER
+    )
     bpy.types.Scene.acc_shift = bpy.props.IntProperty(
         name='Accuracy (lower is faster!)',
         default = 25,
         min=1,
         soft_max=50
     )
+    bpy.types.Scene.tol_shift = bpy.props.FloatProperty(
+        name='Tolerance',
+        description='Stop the k-mean once no color moves further than this (0-255 units)',
+        default=colorz.DEFAULT_TOLERANCE,
+        min=0.0,
+        soft_max=10.0
+    )
+    bpy.types.Scene.warm_shift = bpy.props.BoolProperty(
+        name='Warm Start',
+        description='Start the k-mean from the last colors found, and resume it when only accuracy was raised',
+        default=False
+    )
+    bpy.types.Scene.minibatch_shift = bpy.props.BoolProperty(
+        name='Mini-batch K-mean',
+        description='Cluster random batches of a larger sample of the wallpaper',
+        default=False
+    )
+    bpy.types.Scene.batch_shift = bpy.props.IntProperty(
+        name='Batch Size',
+        default=colorz.DEFAULT_BATCH_SIZE,
+        min=16,
+        soft_max=8192
+    )
+    bpy.types.Scene.batch_iter_shift = bpy.props.IntProperty(
+        name='Batch Iterations',
+        default=colorz.DEFAULT_BATCH_ITER,
+        min=1,
+        soft_max=500
+    )
+    bpy.types.Scene.workers_shift = bpy.props.IntProperty(
+        name='Worker Processes',
+        description='Run the restarts in parallel over this many processes (0 or 1 keeps them in Blender)',
+        default=0,
+        min=0,
+        soft_max=os.cpu_count() or 1
+    )
+    bpy.types.Scene.restarts_shift = bpy.props.IntProperty(
+        name='Restarts',
+        description='Run the k-mean this many times from different seeds and keep the tightest fit',
+        default=1,
+        min=1,
+        soft_max=16
+    )
+    bpy.types.Scene.resize_shift = bpy.props.EnumProperty(
+        name='Downsampling',
+        items=[
+            ('AREA', 'Area Average', 'Average every block of pixels (best quality)'),
+            ('STRIDE', 'Stride', 'Sample one pixel per block (fastest)'),
+        ],
+        default=colorz.DEFAULT_RESIZE_MODE
+    )
+    bpy.types.Scene.bits_shift = bpy.props.IntProperty(
+        name='Color Precision (bits)',
+        description='Bits per channel of the color histogram fed to the k-mean',
+        default=colorz.DEFAULT_BIN_BITS,
+        min=4,
+        max=8
+    )
+    bpy.types.Scene.monitors_shift = bpy.props.BoolProperty(
+        name='All Monitors',
+        description='Blend the wallpapers of every monitor into one palette',
+        default=True
+    )
     
+    bpy.types.Scene.watch_shift = bpy.props.BoolProperty(
+        name='Watch Wallpaper',
+        description='Regenerate and load the theme whenever the wallpaper changes',
+        default=False,
+        update=watch.toggle
+    )
+    bpy.types.Scene.debug_shift = bpy.props.BoolProperty(
+        name='Profile (debug)',
+        description='Dump a cProfile of each run to the cache directory',
+        default=False
+    )
+
     bpy.types.Scene.saturation_shift = bpy.props.FloatProperty(
         name='Saturation Shift',
         default=1.0,
         soft_min=0.0,
-        soft_max=3.0
+        soft_max=3.0,
+        update=pipeline.refresh
     )
 
 def clear_properties():
     del bpy.types.Scene.axis_shift
     del bpy.types.Scene.saturation_shift
     del bpy.types.Scene.rand_shift
+    del bpy.types.Scene.quantizer_shift
     del bpy.types.Scene.acc_shift
+    del bpy.types.Scene.tol_shift
+    del bpy.types.Scene.warm_shift
+    del bpy.types.Scene.minibatch_shift
+    del bpy.types.Scene.batch_shift
+    del bpy.types.Scene.batch_iter_shift
+    del bpy.types.Scene.workers_shift
+    del bpy.types.Scene.restarts_shift
+    del bpy.types.Scene.resize_shift
+    del bpy.types.Scene.bits_shift
+    del bpy.types.Scene.monitors_shift
+    del bpy.types.Scene.debug_shift
+    del bpy.types.Scene.watch_shift
+
+class WAL_preferences(bpy.types.AddonPreferences):
+    bl_idname = __package__
+
+    prefetch_wallpaper: bpy.props.BoolProperty(
+        name='Resolve Wallpaper on Startup',
+        description='Look up the desktop wallpaper in the background when the add-on loads',
+        default=True
+    )
+
+    library_dir: bpy.props.StringProperty(
+        name='Wallpaper Library',
+        description='Directory of wallpapers to index for instant themes and similar-palette search',
+        subtype='DIR_PATH',
+        default=''
+    )
+
+    def draw(self, context):
+        self.layout.prop(self, "prefetch_wallpaper")
+        self.layout.prop(self, "library_dir")
+
+def startup():
+    addon = bpy.context.preferences.addons.get(__package__)
+    if addon is None or addon.preferences.prefetch_wallpaper:
+        wallpaper.prefetch_wallpaper()
+    watch.on_load(None)
+    return None
 
 class MainPanel(bpy.types.Panel):
     bl_label = "Wal Theme"
@@ -58,86 +187,187 @@ class MainPanel(bpy.types.Panel):
         layout.prop(context.scene, "axis_shift")
         layout.prop(context.scene, "rand_shift")
         layout.prop(context.scene, "saturation_shift")
-        layout.prop(context.scene, "acc_shift")
+        layout.prop(context.scene, "quantizer_shift")
+        if context.scene.quantizer_shift == 'KMEANS':
+            layout.prop(context.scene, "acc_shift")
+            layout.prop(context.scene, "tol_shift")
+            layout.prop(context.scene, "warm_shift")
+            layout.prop(context.scene, "minibatch_shift")
+            if context.scene.minibatch_shift:
+                layout.prop(context.scene, "batch_shift")
+                layout.prop(context.scene, "batch_iter_shift")
+            else:
+                layout.prop(context.scene, "restarts_shift")
+                if context.scene.restarts_shift > 1:
+                    layout.prop(context.scene, "workers_shift")
+        layout.prop(context.scene, "resize_shift")
+        layout.prop(context.scene, "bits_shift")
+        layout.prop(context.scene, "monitors_shift")
         layout.operator("wal.operator")
+        layout.operator("wal.save_preset")
+        layout.prop(context.scene, "watch_shift")
+        layout.prop(context.scene, "debug_shift")
+        if pipeline.library_dir():
+            box = layout.box()
+            box.operator("wal.build_library")
+            box.operator("wal.find_similar")
+            for path, distance in pipeline.similar_wallpapers:
+                box.operator("wal.apply_library", text="%s (%.0f)" % (os.path.basename(path), distance)).path = path
+        stats = profiling.last_run
+        if stats:
+            box = layout.box()
+            box.label(text="Last run: %.1f ms" % (stats.total * 1000))
+            for line in stats.lines():
+                box.label(text=line)
         
 class WAL_operator(bpy.types.Operator):
     bl_idname = "wal.operator"
     bl_label = "Make Wallpaper Theme"
     bl_options = {"REGISTER", "UNDO"}
-    bl_description = "Makes Blender theme from wallpaper colors accessible under Preferences > Themes"
+    bl_description = "Applies wallpaper colors to the current Blender theme"
     
-    def modulate(self, val, mod, sat): 
-        r=int(val[1:3], 16)/255.0
-        g=int(val[3:5], 16)/255.0
-        b=int(val[5:7], 16)/255.0
-        h,l,s=colorsys.rgb_to_hls(r, g, b)
-        l=max(0.0, min(1.0, l*mod))         
-        s=max(0.0, min(1.0, s*sat*0.8/(mod))) 
-        r, g, b=colorsys.hls_to_rgb(h, l, s)
-        r=f"{int(r * 255):02x}"
-        g=f"{int(g * 255):02x}"
-        b=f"{int(b* 255):02x}"
-        return "#"+r+g+b
-
-    def apply_colors(self, home, workingdir, blenderversion, axis_change, saturation, rand, acc):
-        image = wallpaper.get_desktop_wallpaper(wallpaper.get_desktop_env())
-        try:
-            image = os.path.expanduser(os.path.normpath(image.replace('$HOME', '~')))
-        except:
-            pass
-        if image is None:
+    def finish_palette(self, context, key, raw_colors, stats):
+        pipeline.finish(context.scene, key, raw_colors, stats)
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+        return {'FINISHED'}
+
+    def execute(self, context):
+        stats = profiling.RunStats(profile=context.scene.debug_shift)
+        paths, key, raw_colors = pipeline.lookup_palette(context.scene, stats)
+        if paths is None:
             self.report({'ERROR'}, "Could not find wallpaper")
             return {'CANCELLED'}
-        raw_colors = colorz.colorz(bpy.data.images.load(image), n=6, bold_add=0, randomness=rand, accuracy=acc)
-        colors =["#000000"] + [wallpaper.rgb_to_hex([*color[0]]) for color in raw_colors]
-        while len(colors)<30:
-            colors.append("#000000")
-        
+        if raw_colors is not None:
+            return self.finish_palette(context, None, raw_colors, stats)
+        raw_colors = pipeline.extract(paths, context.scene, stats)
+        return self.finish_palette(context, key, raw_colors, stats)
 
+    def invoke(self, context, event):
+        stats = profiling.RunStats(profile=context.scene.debug_shift)
+        paths, key, raw_colors = pipeline.lookup_palette(context.scene, stats)
+        if paths is None:
+            self.report({'ERROR'}, "Could not find wallpaper")
+            return {'CANCELLED'}
+        if raw_colors is not None:
+            return self.finish_palette(context, None, raw_colors, stats)
 
+        self._key = key
+        self._stats = stats
+        self._job = pipeline.start_extraction(paths, context.scene, stats)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        for i in range(9,16):
-            colors[i] = self.modulate(colors[i-8], .6, saturation)
-            colors[i+7] = self.modulate(colors[i-8], 1.25, saturation)
-            colors[i+14] = self.modulate(colors[i-8], .4, saturation)
-        with open(f"{workingdir}/blendertemplate.xml", "r") as templatefile:
-            contents = templatefile.read()
-        for i in range(0, 26):
-            contents = re.sub("color"+str(i)+"_", colors[i], contents)
-        if axis_change:
-            contents = re.sub("x-axis-color_", colors[20], contents)
-            contents = re.sub("y-axis-color_", colors[21], contents)
-            contents = re.sub("z-axis-color_", colors[18], contents)
-            contents = re.sub("grid-color_", colors[19], contents)
-        else:
-            contents = re.sub("x-axis-color_", "#ff3352", contents)
-            contents = re.sub("y-axis-color_", "#8bdc00", contents)
-            contents = re.sub("z-axis-color_", "#2890ff", contents)
-            contents = re.sub("grid-color_", "#545454", contents)
-        theme_dir = bpy.utils.user_resource( 'SCRIPTS', path="presets/interface_theme", create=True)
-        with open(os.path.join(theme_dir, "Wal_Theme.xml"), "w") as templatefile:
-            templatefile.write(contents)
-        
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._job.cancel()
+            self.stop(context)
+            self.report({'INFO'}, "Wallpaper theme cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        if not self._job.done:
+            step, total = self._job.progress
+            context.workspace.status_text_set(f"Wal Theme: clustering {step}/{total} (Esc to cancel)")
+            return {'PASS_THROUGH'}
+
+        self.stop(context)
+        if self._job.result is None:
+            self.report({'ERROR'}, f"Could not extract palette: {self._job.error}")
+            return {'CANCELLED'}
+        return self.finish_palette(context, self._key, self._job.result, self._stats)
+
+    def stop(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.workspace.status_text_set(None)
+
+class WAL_save_preset(bpy.types.Operator):
+    bl_idname = "wal.save_preset"
+    bl_label = "Save Theme Preset"
+    bl_description = "Saves the last wallpaper theme as a preset under Preferences > Themes"
+
+    @classmethod
+    def poll(cls, context):
+        return pipeline.last_palette is not None
 
     def execute(self, context):
-        workingdir = os.path.dirname(os.path.abspath(__file__))
-        home = os.path.expanduser("~")
-        blenderversion = f"{bpy.app.version[0]}.{bpy.app.version[1]}"
-        self.apply_colors(home, workingdir, blenderversion, context.scene.axis_shift, context.scene.saturation_shift, context.scene.rand_shift, context.scene.acc_shift)
+        stats = profiling.RunStats()
+        path = pipeline.write_theme(pipeline.last_palette, context.scene, stats)
+        self.report({'INFO'}, "Theme preset written to %s" % path)
         return {'FINISHED'}
     
+class WAL_build_library(bpy.types.Operator):
+    bl_idname = "wal.build_library"
+    bl_label = "Build Palette Library"
+    bl_description = "Index the palettes of new and changed wallpapers in the library directory"
+
+    def execute(self, context):
+        entries, extracted, failed = pipeline.build_library(context.scene)
+        self.report({'WARNING'} if failed else {'INFO'},
+                    f"{entries} wallpapers indexed, {extracted} extracted, {failed} failed")
+        return {'FINISHED'}
+
+class WAL_find_similar(bpy.types.Operator):
+    bl_idname = "wal.find_similar"
+    bl_label = "Find Similar Wallpapers"
+    bl_description = "List library wallpapers with a palette like the current theme"
+
+    @classmethod
+    def poll(cls, context):
+        return pipeline.last_palette is not None
+
+    def execute(self, context):
+        if not pipeline.find_similar():
+            self.report({'WARNING'}, "The palette library is empty")
+        return {'FINISHED'}
+
+class WAL_apply_library(bpy.types.Operator):
+    bl_idname = "wal.apply_library"
+    bl_label = "Apply Library Theme"
+    bl_description = "Apply the indexed palette of this wallpaper"
+    bl_options = {"REGISTER", "UNDO"}
+
+    path: bpy.props.StringProperty()
+
+    def execute(self, context):
+        from . import library
+        raw_colors = library.lookup(self.path)
+        if raw_colors is None:
+            self.report({'ERROR'}, "Wallpaper changed since the library was built")
+            return {'CANCELLED'}
+        pipeline.finish(context.scene, None, raw_colors, profiling.RunStats())
+        return {'FINISHED'}
+
 classes = [
+    WAL_preferences,
     MainPanel,
     WAL_operator,
+    WAL_save_preset,
+    WAL_build_library,
+    WAL_find_similar,
+    WAL_apply_library,
 ]
     
 def register():
     for c in classes:
         bpy.utils.register_class(c)
     init_properties()
+    template.load()
+    bpy.app.timers.register(startup, first_interval=0.1)
+    bpy.app.handlers.load_post.append(watch.on_load)
 
 def unregister():
+    if bpy.app.timers.is_registered(startup):
+        bpy.app.timers.unregister(startup)
+    if watch.on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(watch.on_load)
+    watch.stop()
+    parallel = sys.modules.get(__name__ + ".parallel")
+    if parallel:
+        parallel.shutdown()
     for c in classes:
         bpy.utils.unregister_class(c)
     clear_properties()
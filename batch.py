@@ -0,0 +1,165 @@
+"""
+Headless batch theming.
+
+Themes every wallpaper in the given directories or globs in parallel and
+writes one Wal_Theme XML per image, plus a palettes.json manifest.
+
+    python batch.py ~/Pictures/wallpapers -o themes
+    blender --background --python batch.py -- ~/Pictures/wallpapers -o themes
+"""
+
+import os
+import sys
+import glob
+import json
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+if __package__:
+    from . import colorz, images, theme, wallpaper, frames
+else:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import colorz, images, theme, wallpaper, frames
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tga", ".tif", ".tiff", ".webp", ".ppm", ".gif",
+                    *frames.VIDEO_EXTENSIONS)
+DEFAULT_OUTPUT = "wal_themes"
+MANIFEST_NAME = "palettes.json"
+DEFAULT_OPTIONS = dict(n=6, bold_add=0, accuracy=25)
+
+
+def find_images(patterns):
+    """Expand directories and globs into a sorted list of image paths."""
+    found = set()
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern)
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                found.update(os.path.join(root, f) for f in files
+                             if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            found.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in found)
+
+
+def extract(path, options, backend=None):
+    """Worker: decode one wallpaper and return its palette."""
+    return images.palette_from_file(path, backend, **options)
+
+
+def theme_names(paths):
+    """Pick a unique theme file name for every image."""
+    names, used = {}, set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, i = f"Wal_Theme_{stem}.xml", 1
+        while name in used:
+            i += 1
+            name = f"Wal_Theme_{stem}_{i}.xml"
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def extract_all(paths, options, jobs=None, on_palette=None):
+    """
+    Call on_palette(path, get_palette) for every path as its palette is ready.
+
+    Images are decoded and clustered in a process pool, except those only
+    bpy can read, which cannot leave Blender's process and run in order.
+    get_palette returns the palette or raises the extraction error.
+    """
+    backends = {p: images.pick_backend(p) for p in paths}
+    local = [p for p in paths if jobs == 1 or images.needs_main_thread(backends[p])]
+    pooled = [p for p in paths if p not in local]
+    if pooled:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(extract, p, options, backends[p]): p for p in pooled}
+            for future in as_completed(futures):
+                on_palette(futures[future], future.result)
+    for p in local:
+        on_palette(p, lambda: extract(p, options, backends[p]))
+
+
+def run(paths, output, options, axis_change=True, saturation=1.0, jobs=None):
+    """
+    Extract and write a theme for every path, see extract_all.
+
+    Returns the manifest and the number of failed images.
+    """
+    os.makedirs(output, exist_ok=True)
+    names = theme_names(paths)
+    manifest = {}
+
+    def finish(path, get_palette):
+        try:
+            raw_colors = get_palette()
+        except Exception as e:
+            logging.error("Error theming %s: %s", path, e)
+            return
+        with open(os.path.join(output, names[path]), "w") as f:
+            f.write(theme.render(raw_colors, axis_change, saturation))
+        manifest[path] = {
+            "theme": names[path],
+            "colors": [wallpaper.rgb_to_hex(color) for color, bold in raw_colors],
+        }
+        print(f"{path} -> {names[path]}")
+
+    extract_all(paths, options, jobs, finish)
+
+    with open(os.path.join(output, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, len(paths) - len(manifest)
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('images', nargs='+',
+                        help="wallpaper directories or glob patterns")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                        help="directory to write themes to. Default: %s" % DEFAULT_OUTPUT)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes. Default: one per CPU")
+    parser.add_argument('--quantizer', choices=sorted(colorz.QUANTIZERS),
+                        default=colorz.DEFAULT_QUANTIZER,
+                        help="clustering engine. Default: %s" % colorz.DEFAULT_QUANTIZER)
+    parser.add_argument('--accuracy', type=int, default=25,
+                        help="max k-mean iterations. Default: 25")
+    parser.add_argument('--tolerance', type=float, default=colorz.DEFAULT_TOLERANCE,
+                        help="k-mean convergence tolerance. Default: %s" % colorz.DEFAULT_TOLERANCE)
+    parser.add_argument('--resize-mode', choices=sorted(colorz.RESIZE_MODES),
+                        default=colorz.DEFAULT_RESIZE_MODE,
+                        help="downsampling mode. Default: %s" % colorz.DEFAULT_RESIZE_MODE)
+    parser.add_argument('--bits', type=int, default=colorz.DEFAULT_BIN_BITS,
+                        help="histogram bits per channel. Default: %s" % colorz.DEFAULT_BIN_BITS)
+    parser.add_argument('--saturation', type=float, default=1.0,
+                        help="saturation shift. Default: 1.0")
+    parser.add_argument('--random', action='store_true',
+                        help="use an unseeded k-mean")
+    parser.add_argument('--no-axis', action='store_true',
+                        help="keep Blender's default axis and grid colors")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        # Blender passes script arguments after "--".
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    options = dict(DEFAULT_OPTIONS, randomness=args.random, accuracy=args.accuracy,
+                   tolerance=args.tolerance, resize_mode=args.resize_mode, bin_bits=args.bits,
+                   quantizer=args.quantizer)
+
+    paths = find_images(args.images)
+    if not paths:
+        logging.error("No wallpapers found")
+        return 1
+    _, failed = run(paths, args.output, options, not args.no_axis, args.saturation, args.jobs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Benchmark for the palette pipeline.
+
+Runs every stage of colorz.colorz on synthetic wallpapers (and optional
+fixture images) at several resolutions and accuracy levels, reporting
+per-stage wall time and tracemalloc peak memory as JSON; the total covers
+the k-means pipeline, not the alternative quantizers. With --baseline,
+stages that got slower than the threshold fail the run.
+
+Needs only NumPy: Blender images are replaced by a stub.
+
+    python benchmark.py -o bench.json
+    python benchmark.py --baseline bench.json --threshold 0.25
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+
+if __package__:
+    from . import colorz, images
+else:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import colorz, images
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+ACCURACIES = (1, 10, 25, 50)
+DEFAULT_THRESHOLD = 0.25
+MIN_DELTA = 0.001
+# Timed and compared like the other stages, but left out of the total:
+# the pipeline only runs one quantizer.
+ALTERNATIVE_STAGES = ("median_cut", "octree")
+
+
+class StubPixels:
+    def __init__(self, data):
+        self.data = data
+
+    def foreach_get(self, buf):
+        buf[:] = self.data
+
+
+class StubImage:
+    """Stands in for bpy.types.Image so get_pixels runs without Blender."""
+
+    def __init__(self, pixels):
+        height, width, self.channels = pixels.shape
+        self.size = (width, height)
+        self.pixels = StubPixels(pixels.reshape(-1))
+
+
+def synthetic_image(width, height, seed=0):
+    """A few smooth color gradients plus noise, as (H, W, 4) float32."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 4), dtype=np.float32)
+    img[..., 0] = x
+    img[..., 1] = y
+    img[..., 2] = 0.5 + 0.5 * np.sin(6.0 * x) * np.cos(4.0 * y)
+    img[..., :3] += rng.normal(0.0, 0.03, (height, width, 1)).astype(np.float32)
+    img[..., 3] = 1.0
+    return img
+
+
+def stages(accuracy):
+    """
+    The colorz.colorz pipeline split into named stages, plus the
+    ALTERNATIVE_STAGES quantizers run on the same colors.
+    """
+    opts = dict(n=colorz.DEFAULT_NUM_COLORS, min_v=colorz.DEFAULT_MINV, max_v=colorz.DEFAULT_MAXV)
+    return [
+        ("get_pixels", lambda s: colorz.get_pixels(s["image"])),
+        ("resize", lambda s: colorz.resize(s["get_pixels"], *colorz.THUMB_SIZE)),
+        ("get_colors", lambda s: colorz.get_colors(colorz.to_rgb(s["resize"]))),
+        ("clamp", lambda s: colorz.clamp(s["get_colors"][0], opts["min_v"], opts["max_v"])),
+        ("kmeans", lambda s: colorz.kmeans(False, s["clamp"].astype(float), s["get_colors"][1],
+                                           opts["n"], max_iter=accuracy)),
+        ("median_cut", lambda s: colorz.median_cut(False, s["clamp"].astype(float), s["get_colors"][1], opts["n"])),
+        ("octree", lambda s: colorz.octree(False, s["clamp"].astype(float), s["get_colors"][1], opts["n"])),
+        ("order_by_hue", lambda s: colorz.order_by_hue(s["kmeans"])),
+    ]
+
+
+def run_stage(func, state, repeat, memory):
+    """Best wall time over repeat runs, plus peak traced memory of one more."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(state)
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {"time": min(times), "peak_bytes": peak}
+
+
+def bench_image(name, pixels, accuracies, repeat=3, memory=True):
+    results = []
+    for accuracy in accuracies:
+        state = {"image": StubImage(pixels)}
+        timings = {}
+        for stage, func in stages(accuracy):
+            state[stage], timings[stage] = run_stage(func, state, repeat, memory)
+        results.append({
+            "image": name,
+            "width": pixels.shape[1],
+            "height": pixels.shape[0],
+            "accuracy": accuracy,
+            "stages": timings,
+            "total": sum(t["time"] for stage, t in timings.items() if stage not in ALTERNATIVE_STAGES),
+        })
+        print("%-20s acc=%-3d %8.1f ms" % (name, accuracy, results[-1]["total"] * 1000))
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return a message for every stage slower than baseline by more than threshold."""
+    base = {(r["image"], r["accuracy"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = base.get((result["image"], result["accuracy"]))
+        if old is None:
+            continue
+        for stage, timing in result["stages"].items():
+            before = old["stages"].get(stage, {}).get("time")
+            if before is None:
+                continue
+            if timing["time"] > before * (1 + threshold) and timing["time"] - before > MIN_DELTA:
+                regressions.append("%s acc=%d %s: %.1f ms -> %.1f ms" % (
+                    result["image"], result["accuracy"], stage, before * 1000, timing["time"] * 1000))
+    return regressions
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+
+    parser.add_argument('fixtures', nargs='*',
+                        help="extra wallpaper files to benchmark")
+    parser.add_argument('-r', '--resolutions', nargs='*', default=list(RESOLUTIONS),
+                        choices=list(RESOLUTIONS),
+                        help="synthetic resolutions. Default: all")
+    parser.add_argument('-a', '--accuracy', nargs='*', type=int, default=list(ACCURACIES),
+                        help="accuracy levels. Default: %s" % " ".join(map(str, ACCURACIES)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timed runs per stage, the fastest is kept. Default: 3")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the tracemalloc pass")
+    parser.add_argument('-o', '--output',
+                        help="write the JSON report to this file")
+    parser.add_argument('--baseline',
+                        help="JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown per stage, as a fraction. Default: %s" % DEFAULT_THRESHOLD)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    memory = not args.no_memory
+
+    results = []
+    for name in args.resolutions:
+        pixels = synthetic_image(*RESOLUTIONS[name])
+        results += bench_image("synthetic-" + name, pixels, args.accuracy, args.repeat, memory)
+    for path in args.fixtures:
+        results += bench_image(os.path.basename(path), images.load_pixels(path),
+                               args.accuracy, args.repeat, memory)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION " + line)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
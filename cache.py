@@ -0,0 +1,110 @@
+"""
+On-disk palette cache.
+
+Palettes are stored as small JSON files under the XDG cache directory,
+keyed by the wallpapers' paths, mtimes and sizes plus the extraction
+parameters. The least recently used entries are evicted once the cache
+holds more than MAX_ENTRIES palettes.
+
+Converged k-means centers are kept in a directory of their own as warm
+start state, per wallpaper and under LAST_STATE for the most recent run,
+and evicted the same way without counting against the palettes.
+"""
+
+import os
+import json
+import hashlib
+import logging
+try:
+    from .wallpaper import XDG_CACHE_DIR
+except ImportError:
+    from wallpaper import XDG_CACHE_DIR
+
+CACHE_DIR = os.path.join(XDG_CACHE_DIR, "wal_theme", "palettes")
+STATE_DIR = os.path.join(XDG_CACHE_DIR, "wal_theme", "states")
+CACHE_VERSION = 2
+MAX_ENTRIES = 64
+LAST_STATE = "last"
+
+
+def palette_key(paths, **params):
+    """Build a cache key for one wallpaper path, or a list of them, and extraction parameters."""
+    if isinstance(paths, str):
+        paths = [paths]
+    try:
+        files = [(os.path.abspath(p), os.stat(p)) for p in paths]
+    except OSError:
+        return None
+    ident = json.dumps([CACHE_VERSION, [(p, s.st_mtime_ns, s.st_size) for p, s in files],
+                        sorted(params.items())], default=str)
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+def entry_path(key, directory=CACHE_DIR):
+    """Return the file a cache key is stored in."""
+    return os.path.join(directory, key + ".json")
+
+
+def load_palette(key):
+    """Return the cached (color, bold) pairs for key, or None on a miss."""
+    path = entry_path(key)
+    try:
+        with open(path) as f:
+            pairs = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return [(tuple(color), tuple(bold)) for color, bold in pairs]
+
+
+def save_palette(key, pairs):
+    """Store (color, bold) pairs under key and evict stale entries."""
+    pairs = [[[int(c) for c in color], [int(c) for c in bold]] for color, bold in pairs]
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = entry_path(key) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(pairs, f)
+        os.replace(tmp, entry_path(key))
+        evict()
+    except OSError as e:
+        logging.error("Error writing palette cache: %s", e)
+
+
+def load_state(key):
+    """Return the warm start state stored under key, or None."""
+    path = entry_path(key, STATE_DIR)
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return state
+
+
+def save_state(key, state):
+    """Store a k-means warm start state dict under key and evict stale states."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp = entry_path(key, STATE_DIR) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, entry_path(key, STATE_DIR))
+        evict(directory=STATE_DIR)
+    except OSError as e:
+        logging.error("Error writing k-means state: %s", e)
+
+
+def evict(max_entries=MAX_ENTRIES, directory=CACHE_DIR):
+    """Remove the least recently used entries of directory beyond max_entries."""
+    entries = [e for e in os.scandir(directory) if e.name.endswith(".json")]
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[max_entries:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
@@ -0,0 +1,78 @@
+"""
+Array versions of colorsys' rgb<->hsv and rgb<->hls conversions.
+
+Every function takes an array whose last axis holds the three channels,
+in the 0-1 range, so a single color (3,) and a batch (N, 3) both work.
+Results match colorsys color for color.
+"""
+
+import numpy as np
+
+
+def _hue(rgb, maxc, rangec):
+    """Hue shared by the HSV and HLS models, with 0 for greys."""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+        h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+        h = (h / 6.0) % 1.0
+    return np.where(rangec == 0, 0.0, h)
+
+
+def rgb_to_hsv(rgb):
+    rgb = np.asarray(rgb, dtype=float)
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    rangec = maxc - minc
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = np.where(rangec == 0, 0.0, rangec / maxc)
+    return np.stack([_hue(rgb, maxc, rangec), s, maxc], axis=-1)
+
+
+def hsv_to_rgb(hsv):
+    hsv = np.asarray(hsv, dtype=float)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    i = np.floor(h * 6.0)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(int) % 6
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    rgb = np.stack([r, g, b], axis=-1)
+    return np.where((s == 0.0)[..., None], v[..., None], rgb)
+
+
+def rgb_to_hls(rgb):
+    rgb = np.asarray(rgb, dtype=float)
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    l = sumc / 2.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = np.where(l <= 0.5, rangec / sumc, rangec / (2.0 - sumc))
+    s = np.where(rangec == 0, 0.0, s)
+    return np.stack([_hue(rgb, maxc, rangec), l, s], axis=-1)
+
+
+def _hls_channel(m1, m2, hue):
+    hue = hue % 1.0
+    return np.where(hue < 1.0 / 6.0, m1 + (m2 - m1) * hue * 6.0,
+           np.where(hue < 0.5, m2,
+           np.where(hue < 2.0 / 3.0, m1 + (m2 - m1) * (2.0 / 3.0 - hue) * 6.0, m1)))
+
+
+def hls_to_rgb(hls):
+    hls = np.asarray(hls, dtype=float)
+    h, l, s = hls[..., 0], hls[..., 1], hls[..., 2]
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - l * s)
+    m1 = 2.0 * l - m2
+    rgb = np.stack([_hls_channel(m1, m2, h + 1.0 / 3.0),
+                    _hls_channel(m1, m2, h),
+                    _hls_channel(m1, m2, h - 1.0 / 3.0)], axis=-1)
+    return np.where((s == 0.0)[..., None], l[..., None], rgb)
@@ -10,15 +10,17 @@ Finally, outputs the colors to stdout
 generates an HTML preview of the color scheme.
 """
 
-import bpy
 import os
 from tempfile import NamedTemporaryFile
 from argparse import ArgumentParser
-from colorsys import rgb_to_hsv, hsv_to_rgb
-from numpy import array
-import random
+import numpy as np
+try:
+    from . import colorspace
+    from .profiling import timed, RunStats
+except ImportError:
+    import colorspace
+    from profiling import timed, RunStats
 import math
-from collections import Counter
 DEFAULT_NUM_COLORS = 6
 DEFAULT_MINV = 110
 DEFAULT_MAXV = 255
@@ -26,8 +28,15 @@ DEFAULT_BOLD_ADD = 50
 DEFAULT_FONT_SIZE = 1
 DEFAULT_BG_COLOR = '#272727'
 DEFAULT_ACCURACY = 100
+DEFAULT_RESIZE_MODE = 'AREA'
+DEFAULT_BIN_BITS = 8
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_BATCH_ITER = 100
+DEFAULT_QUANTIZER = 'KMEANS'
 
 THUMB_SIZE = (200, 200)
+MINIBATCH_THUMB_SIZE = (1024, 1024)
 SCALE = 256.0
 
 def distance(c1, c2):
@@ -39,68 +48,336 @@ def mean_color(points):
     return tuple(sum(p[i] for p in points) / n for i in range(len(points[0])))
 
 
-def kmeans(rand, points, weights, k, max_iter=100):
-    points = list(points)
-    if not rand:
-        random.seed(216)
-    centers = random.sample(points, k)
-
-    for _ in range(max_iter):
-        clusters = [[] for _ in range(k)]
-        clusters_weights = [[] for _ in range(k)]
-        for p, w in zip(points, weights):
-            distances = [distance(p, c) for c in centers]
-            cluster_idx = distances.index(min(distances))
-            clusters[cluster_idx].append(p)
-            clusters_weights[cluster_idx].append(w)
-        new_centers = []
-        for cluster, wts in zip(clusters, clusters_weights):
-            if cluster:
-                weighted_sum = [0.0]*len(cluster[0])
-                total_w = sum(wts)
-                for pt, wt in zip(cluster, wts):
-                    for i in range(len(pt)):
-                        weighted_sum[i] += pt[i] * wt
-                mean = tuple(c/total_w for c in weighted_sum)
-                new_centers.append(mean)
-            else:
-                new_centers.append(random.choice(points))
-        if all(distance(a, b) <  1e-3 for a, b in zip(centers, new_centers)):
-            break
+def assign(points, centers):
+    """
+    Returns the index of the nearest center for every point.
+
+    Squared distances are expanded as |p|^2 - 2p.c + |c|^2 so the
+    (N, k) matrix is built with a single matrix product.
+    """
+    dists = (np.einsum('ij,ij->i', points, points)[:, None]
+             - 2.0 * points @ centers.T
+             + np.einsum('ij,ij->i', centers, centers)[None, :])
+    return dists.argmin(axis=1)
+
+
+def cluster_sums(points, weights, labels, k):
+    """
+    Returns the weighted sum of the points in every cluster and the
+    per-cluster weight.
+    """
+    totals = np.bincount(labels, weights=weights, minlength=k)
+    sums = np.empty((k, points.shape[1]))
+    for i in range(points.shape[1]):
+        sums[:, i] = np.bincount(labels, weights=weights * points[:, i], minlength=k)
+    return sums, totals
+
+
+def update_centers(points, weights, labels, k):
+    """
+    Returns the weighted mean of every cluster and the per-cluster weight.
+    """
+    sums, totals = cluster_sums(points, weights, labels, k)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / totals[:, None], totals
+
+
+def inertia(points, weights, centers):
+    """Weighted sum of squared distances from every point to its nearest center."""
+    d2 = ((points - centers[assign(points, centers)]) ** 2).sum(axis=1)
+    return float((weights * d2).sum())
+
+
+def kmeans_pp(points, weights, k, rng):
+    """
+    Weighted k-means++ seeding.
+
+    Each new center is drawn with probability proportional to its weight
+    times its squared distance from the nearest center picked so far, so
+    duplicate or near-identical starting colors are unlikely.
+    """
+    n = len(points)
+    idx = rng.choice(n, p=weights / weights.sum())
+    centers = [points[idx]]
+    d2 = ((points - points[idx]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        prob = weights * d2
+        total = prob.sum()
+        idx = rng.choice(n, p=prob / total) if total > 0 else rng.choice(n)
+        centers.append(points[idx])
+        d2 = np.minimum(d2, ((points - points[idx]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+def kmeans(rand, points, weights, k, max_iter=100, tol=DEFAULT_TOLERANCE, progress=None, stats=None,
+           seed=None, reduce=None, init=None):
+    """
+    Weighted k-means over points, seeded with kmeans_pp or starting from
+    the k centers in init.
+
+    Stops early once no center moves more than tol (in 0-255 color units).
+    Runs are reproducible unless rand is set, or seed picks another
+    reproducible run. reduce, if given, maps the current centers to the
+    cluster_sums of all points, which lets parallel.py spread that work
+    over processes. The iterations used and the final center shift are
+    recorded in stats.info when stats is given.
+    """
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if init is not None:
+        centers = np.array(init, dtype=float)
+    else:
+        rng = np.random.default_rng(seed if seed is not None else None if rand else 216)
+        centers = kmeans_pp(points, weights, k, rng)
+
+    for it in range(max_iter):
+        if progress:
+            progress(it + 1, max_iter)
+        if reduce:
+            sums, totals = reduce(centers)
+        else:
+            sums, totals = cluster_sums(points, weights, assign(points, centers), k)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            new_centers = sums / totals[:, None]
+        empty = totals == 0
+        if empty.any():
+            # Restart empty clusters on the points furthest from their center,
+            # reusing points when there are fewer of them than empty clusters.
+            labels = assign(points, centers)
+            d2 = ((points - centers[labels]) ** 2).sum(axis=1)
+            new_centers[empty] = points[np.resize(np.argsort(d2)[::-1], int(empty.sum()))]
+        shift = np.sqrt(((new_centers - centers) ** 2).sum(axis=1))
         centers = new_centers
-    return centers
+        if (shift <= tol).all():
+            break
+    if stats and max_iter:
+        stats.info.update(iterations=it + 1, delta=float(shift.max()))
+    return [tuple(c) for c in centers]
     
-def resize(pixels, width, height, new_width, new_height):
-    resized = []
+def minibatch_kmeans(rand, points, weights, k, batch_size=DEFAULT_BATCH_SIZE,
+                     max_iter=DEFAULT_BATCH_ITER, tol=DEFAULT_TOLERANCE, progress=None, stats=None):
+    """
+    Mini-batch k-means over a weighted point population.
+
+    Every iteration draws batch_size points with probability proportional
+    to their weight and moves each center towards the mean of its batch
+    members with a per-center learning rate of 1 / points seen so far.
+    Cost per iteration only depends on batch_size and k.
+    """
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    rng = np.random.default_rng(None if rand else 216)
+    centers = kmeans_pp(points, weights, k, rng)
+    prob = weights / weights.sum()
+    seen = np.zeros(k)
+
+    for it in range(max_iter):
+        if progress:
+            progress(it + 1, max_iter)
+        batch = points[rng.choice(len(points), batch_size, p=prob)]
+        labels = assign(batch, centers)
+        means, counts = update_centers(batch, np.ones(len(batch)), labels, k)
+        seen += counts
+        hit = counts > 0
+        rate = np.zeros(k)
+        rate[hit] = counts[hit] / seen[hit]
+        new_centers = centers.copy()
+        new_centers[hit] += rate[hit, None] * (means[hit] - centers[hit])
+        shift = np.sqrt(((new_centers - centers) ** 2).sum(axis=1))
+        centers = new_centers
+        if (shift <= tol).all():
+            break
+    if stats and max_iter:
+        stats.info.update(iterations=it + 1, delta=float(shift.max()))
+    return [tuple(c) for c in centers]
+
+
+def warm_start(warm, k, accuracy):
+    """
+    Initial centers and iteration budget for a k-means resumed from warm.
+
+    Centers from a run on the same histogram carry their iteration count,
+    so a higher accuracy only runs the difference and a converged run
+    none at all. Centers with no count just seed a full run.
+    """
+    if not warm or len(warm.get("centers", ())) != k:
+        return None, accuracy
+    if warm.get("converged"):
+        return warm["centers"], 0
+    return warm["centers"], max(accuracy - warm.get("iterations", 0), 0)
+
+
+def leaf_means(points, weights, labels, k):
+    """
+    Weighted mean of every label, heaviest first, padded with copies of
+    the heaviest when there are fewer than k distinct labels.
+    """
+    _, labels = np.unique(labels, return_inverse=True)
+    labels = labels.reshape(-1)
+    means, totals = update_centers(points, weights, labels, labels.max() + 1)
+    means = means[np.argsort(totals)[::-1]]
+    return [tuple(c) for c in means] + [tuple(means[0])] * (k - len(means))
+
+
+def median_cut(rand, points, weights, k, max_iter=None, tol=None, progress=None, stats=None):
+    """
+    Weighted median cut.
+
+    Repeatedly splits the box of colors with the largest weighted squared
+    error along its widest channel, at the weighted median, until there
+    are k boxes. One pass, no iterations; rand, max_iter and tol are
+    ignored.
+    """
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    def error(box):
+        p, w = points[box], weights[box]
+        mean = (p * w[:, None]).sum(axis=0) / w.sum()
+        return float((w * ((p - mean) ** 2).sum(axis=1)).sum())
+
+    boxes = [np.arange(len(points))]
+    errors = [error(boxes[0])]
+    while len(boxes) < k:
+        i = int(np.argmax(errors))
+        if errors[i] <= 0:
+            break
+        box = boxes.pop(i)
+        errors.pop(i)
+        p = points[box]
+        axis = int(np.argmax(p.max(axis=0) - p.min(axis=0)))
+        box = box[np.argsort(p[:, axis], kind='stable')]
+        cum = np.cumsum(weights[box])
+        cut = int(np.clip(np.searchsorted(cum, cum[-1] / 2, side='right'), 1, len(box) - 1))
+        for half in (box[:cut], box[cut:]):
+            boxes.append(half)
+            errors.append(error(half) if len(half) > 1 else 0.0)
+    if progress:
+        progress(1, 1)
+
+    labels = np.empty(len(points), dtype=np.int64)
+    for i, box in enumerate(boxes):
+        labels[box] = i
+    return leaf_means(points, weights, labels, k)
+
+
+def octree(rand, points, weights, k, max_iter=None, tol=None, progress=None, stats=None):
+    """
+    Octree quantizer.
+
+    Every color starts as a depth 8 leaf of the RGB octree. Leaves are
+    folded into their parents from the deepest level up, lightest parents
+    first, until k leaves remain; the last parent may only be partially
+    folded so exactly k are left. One pass, no iterations; rand, max_iter
+    and tol are ignored.
+    """
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    q = np.clip(np.rint(points), 0, 255).astype(np.int64)
+    morton = np.zeros(len(q), dtype=np.int64)
+    for bit in range(7, -1, -1):
+        morton = (morton << 3) | (((q[:, 0] >> bit) & 1) << 2) | (((q[:, 1] >> bit) & 1) << 1) | ((q[:, 2] >> bit) & 1)
+    depth = np.full(len(q), 8, dtype=np.int64)
+
+    def leaves():
+        return (morton >> (3 * (8 - depth))) * 9 + depth
+
+    count = len(np.unique(leaves()))
+    while count > k:
+        d = int(depth.max())
+        deep = np.flatnonzero(depth == d)
+        child = (morton[deep] >> (3 * (8 - d))) & 7
+        parents, inv = np.unique(morton[deep] >> (3 * (9 - d)), return_inverse=True)
+        inv = inv.reshape(-1)
+        parent_weight = np.bincount(inv, weights=weights[deep])
+        pairs = np.unique(inv * 8 + child)
+        children = np.bincount(pairs // 8, minlength=len(parents))
+
+        # Fold whole parents, lightest first, while that keeps >= k leaves.
+        order = np.argsort(parent_weight, kind='stable')
+        saved = np.cumsum(children[order] - 1)
+        full = int(np.searchsorted(saved, count - k, side='right'))
+        folded = np.zeros(len(parents), dtype=bool)
+        folded[order[:full]] = True
+        depth[deep[folded[inv]]] = d - 1
+        count -= int(saved[full - 1]) if full else 0
+
+        if count > k and full < len(order):
+            # Fold just enough of the next parent's lightest children.
+            p = order[full]
+            members = deep[inv == p]
+            member_child = child[inv == p]
+            child_weight = np.bincount(member_child, weights=weights[members], minlength=8)
+            present = np.flatnonzero(child_weight)
+            lightest = present[np.argsort(child_weight[present], kind='stable')][:count - k + 1]
+            depth[members[np.isin(member_child, lightest)]] = d - 1
+            count = k
+    if progress:
+        progress(1, 1)
+    return leaf_means(points, weights, leaves(), k)
+
+
+QUANTIZERS = {
+    'KMEANS': kmeans,
+    'MEDIAN_CUT': median_cut,
+    'OCTREE': octree,
+}
 
-    x_scale = width / new_width
-    y_scale = height / new_height 
     
-    for y in range(new_height):
-        for x in range(new_width):
-            startx = int(x * x_scale)
-            endx= int((x+1) * x_scale)
-            starty = int(y* y_scale)
-            endy = int((y+1) * y_scale)
-
-            r_total, g_total, b_total, count = 0, 0, 0, 0
-
-            for yy in range(starty, endy):
-                for xx in range(startx, endx):
-                    idx = yy*width+xx
-                    r,g,b = pixels[idx]
-                    r_total += r
-                    g_total += g
-                    b_total += b
-                    count += 1
-            
-            if count:
-                avg = (r_total // count, g_total // count, b_total // count)
-            else:
-                avg = (0, 0, 0)
+def block_edges(size, new_size):
+    """
+    Returns the new_size + 1 source offsets bounding each output block.
+    """
+    return np.arange(new_size + 1) * size // new_size
+
+
+def area_resize(pixels, new_width, new_height):
+    """
+    Averages every source block into one output pixel.
 
-            resized.append(pixels[idx])
-    return resized
+    Block sums are taken with np.add.reduceat one axis at a time, which
+    also handles sizes that do not divide evenly.
+    """
+    height, width = pixels.shape[:2]
+    ys = block_edges(height, new_height)
+    xs = block_edges(width, new_width)
+    # Reducing along the contiguous row axis first is much faster.
+    cols = np.add.reduceat(pixels, xs[:-1], axis=1)
+    sums = np.add.reduceat(cols, ys[:-1], axis=0, dtype=np.float64)
+    counts = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+    return sums / counts[..., None]
+
+
+def stride_resize(pixels, new_width, new_height):
+    """
+    Picks the centre pixel of every source block.
+
+    Only the sampled pixels are read, so this is the fastest mode.
+    """
+    height, width = pixels.shape[:2]
+    ys = block_edges(height, new_height)
+    xs = block_edges(width, new_width)
+    return pixels[((ys[:-1] + ys[1:]) // 2)[:, None], ((xs[:-1] + xs[1:]) // 2)[None, :]]
+
+
+RESIZE_MODES = {
+    'AREA': area_resize,
+    'STRIDE': stride_resize,
+}
+
+
+def resize(pixels, new_width, new_height, mode=DEFAULT_RESIZE_MODE):
+    """
+    Downsamples an (H, W, C) pixel array to at most new_width x new_height.
+
+    mode is one of RESIZE_MODES. Images smaller than the target are
+    returned untouched.
+    """
+    height, width = pixels.shape[:2]
+    new_width, new_height = min(new_width, width), min(new_height, height)
+    if (new_width, new_height) == (width, height):
+        return pixels
+    return RESIZE_MODES[mode](pixels, new_width, new_height)
 
 
 def down_scale(x):
@@ -108,59 +385,187 @@ def down_scale(x):
 
 
 def up_scale(x):
-    return int(x * SCALE)
+    return (np.asarray(x) * SCALE).astype(int)
 
 
 def hexify(rgb):
     return '#%s' % ''.join('%02x' % p for p in rgb)
 
 def get_pixels(img):
-    pixels=list(img.pixels)
-    rgb_pixels = [(pixels[i], pixels[i+1], pixels[i+2]) for i in range(0, len(pixels), 4)]
-    rgb_ints=[(int(r*255), int(g*255), int(b*255)) for (r, g, b) in rgb_pixels]
-    return rgb_ints
+    """
+    Reads a bpy image into an (H, W, 4) float32 array.
 
+    Uses foreach_get into a preallocated buffer so the pixels are never
+    materialized as Python floats.
+    """
+    width, height = img.size
+    buf = np.empty(width * height * img.channels, dtype=np.float32)
+    img.pixels.foreach_get(buf)
+    return buf.reshape(height, width, img.channels)
 
-    
-def get_colors(img):
+
+def to_rgb(pixels):
     """
-    Returns a list of all the image's colors.
+    Converts float RGBA pixels to an (N, 3) array of 0-255 integers.
     """
-    counter = Counter(img)
-    return list(counter.items())
+    rgb = pixels[..., :3].reshape(-1, 3)
+    return (np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8)
 
 
-def clamp(color, min_v, max_v):
+def get_colors(img, bits=DEFAULT_BIN_BITS):
     """
-    Clamps a color such that the value is between min_v and max_v.
+    Returns the image's colors binned into a 3-D histogram and the
+    number of pixels in each occupied bin.
+
+    Each channel is reduced to bits bits and the three channels are packed
+    into one integer key. Colors are returned as bin centers, so with 8
+    bits they are exact. The number of points handed to kmeans is bounded
+    by the bin count, whatever the image size.
+    """
+    shift = 8 - bits
+    q = img.astype(np.int32) >> shift
+    keys = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    if bits <= 6:
+        counts = np.bincount(keys, minlength=1 << (3 * bits))
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(keys, return_counts=True)
+    mask = (1 << bits) - 1
+    q = np.stack([keys >> (2 * bits), (keys >> bits) & mask, keys & mask], axis=1)
+    return (q << shift) + ((1 << shift) >> 1), counts
+
+
+def clamp(colors, min_v, max_v):
+    """
+    Clamps an (N, 3) array of colors such that the value is between
+    min_v and max_v.
     """
-    h, s, v = rgb_to_hsv(*map(down_scale, color))
-    min_v, max_v = map(down_scale, (min_v, max_v))
-    v = min(max(min_v, v), max_v)
-    return tuple(map(up_scale, hsv_to_rgb(h, s, v)))
+    hsv = colorspace.rgb_to_hsv(down_scale(np.asarray(colors, dtype=float)))
+    hsv[..., 2] = np.clip(hsv[..., 2], down_scale(min_v), down_scale(max_v))
+    return up_scale(colorspace.hsv_to_rgb(hsv))
 
 
 def order_by_hue(colors):
     """
     Orders colors by hue.
     """
-    hsvs = [rgb_to_hsv(*map(down_scale, color)) for color in colors]
-    hsvs.sort(key=lambda t: t[0])
-    return [tuple(map(up_scale, hsv_to_rgb(*hsv))) for hsv in hsvs]
+    hsvs = colorspace.rgb_to_hsv(down_scale(np.asarray(colors, dtype=float)))
+    hsvs = hsvs[np.argsort(hsvs[:, 0], kind='stable')]
+    return [tuple(c) for c in up_scale(colorspace.hsv_to_rgb(hsvs)).tolist()]
+
+
+def brighten(colors, brightness):
+    """
+    Adds or subtracts value to every color.
+    """
+    hsv = colorspace.rgb_to_hsv(down_scale(np.asarray(colors, dtype=float)))
+    hsv[..., 2] += down_scale(brightness)
+    return [tuple(c) for c in up_scale(colorspace.hsv_to_rgb(hsv)).tolist()]
 
 
-def brighten(color, brightness):
+def colorz(fd, **kwargs):
     """
-    Adds or subtracts value to a color.
+    Get the n most dominant colors of a bpy image.
+
+    Takes the same keyword arguments as palette.
     """
-    h, s, v = rgb_to_hsv(*map(down_scale, color))
-    return tuple(map(up_scale, hsv_to_rgb(h, s, v + down_scale(brightness))))
+    return palette(get_pixels(fd), **kwargs)
+
 
+HISTOGRAM_ARGS = ('thumb_size', 'resize_mode', 'bin_bits')
 
-def colorz(fd, n=DEFAULT_NUM_COLORS, min_v=DEFAULT_MINV, max_v=DEFAULT_MAXV,
-           bold_add=DEFAULT_BOLD_ADD, order_colors=True, randomness=False, accuracy=DEFAULT_ACCURACY):
+
+def histogram(pixels, thumb_size=THUMB_SIZE, resize_mode=DEFAULT_RESIZE_MODE,
+              bin_bits=DEFAULT_BIN_BITS, stats=None):
+    """
+    Downsample an (H, W, C) float pixel array to thumb_size (or keep it at
+    full resolution if thumb_size is None) and bin its colors with
+    bin_bits bits per channel. Returns the bins and their pixel counts.
     """
-    Get the n most dominant colors of an image.
+    with timed(stats, "resize"):
+        img = resize(pixels, *thumb_size, mode=resize_mode) if thumb_size else pixels
+
+    with timed(stats, "quantize"):
+        return get_colors(to_rgb(img), bin_bits)
+
+
+def merge_histograms(histograms):
+    """
+    Sum histograms built with the same bin_bits into one.
+
+    Every thumbnail has about the same number of pixels, so each image
+    weighs the same in the merged histogram whatever its resolution.
+    Counts stay integers unless one of the histograms has float counts.
+    """
+    colors = np.concatenate([c for c, _ in histograms])
+    counts = np.concatenate([w for _, w in histograms])
+    keys = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    merged = np.stack([keys >> 16, (keys >> 8) & 0xff, keys & 0xff], axis=1)
+    return merged, np.bincount(inverse.reshape(-1), weights=counts).astype(counts.dtype)
+
+
+def cluster_palette(colors_only, counts, n=DEFAULT_NUM_COLORS, min_v=DEFAULT_MINV, max_v=DEFAULT_MAXV,
+                    bold_add=DEFAULT_BOLD_ADD, order_colors=True, randomness=False,
+                    accuracy=DEFAULT_ACCURACY, tolerance=DEFAULT_TOLERANCE, batch_size=0,
+                    batch_iter=DEFAULT_BATCH_ITER, progress=None, stats=None, workers=0, restarts=1,
+                    quantizer=DEFAULT_QUANTIZER, warm=None):
+    """
+    Cluster a color histogram into n (color, bold) pairs.
+
+    See palette for the arguments. warm is a dict carrying full k-means
+    state between runs: see warm_start for how its "centers",
+    "iterations" and "converged" are used. It is updated in place with
+    this run's state.
+    """
+    with timed(stats, "clamp"):
+        clamped = clamp(colors_only, min_v, max_v)
+
+    with timed(stats, "cluster"):
+        if quantizer != 'KMEANS':
+            clusters = QUANTIZERS[quantizer](randomness, clamped.astype(float), counts, n,
+                                             progress=progress, stats=stats)
+        elif batch_size:
+            clusters = minibatch_kmeans(randomness, clamped, counts, n, batch_size,
+                                        max_iter=batch_iter, tol=tolerance, progress=progress, stats=stats)
+        else:
+            init, budget = warm_start(warm, n, accuracy)
+            # k-means reports its iterations and last shift through stats.
+            run = stats or RunStats()
+            run.info.pop("iterations", None)
+            if workers > 1 or restarts > 1:
+                try:
+                    from . import parallel
+                except ImportError:
+                    import parallel
+                clusters = parallel.kmeans(randomness, clamped.astype(float), counts, n, max_iter=budget,
+                                           tol=tolerance, workers=workers, restarts=restarts,
+                                           progress=progress, stats=run, init=init)
+            else:
+                clusters = kmeans(randomness, clamped.astype(float), counts, n,
+                                  max_iter=budget, tol=tolerance, progress=progress, stats=run, init=init)
+            if warm is not None:
+                ran = run.info.get("iterations", 0)
+                warm.update(
+                    centers=[[float(c) for c in center] for center in clusters],
+                    iterations=(warm.get("iterations", 0) if init is not None else 0) + ran,
+                    converged=run.info["delta"] <= tolerance if ran else bool(warm.get("converged")),
+                )
+        colors = order_by_hue(clusters) if order_colors else clusters
+        bold = brighten(colors, bold_add)
+    if stats:
+        stats.info.update(pixels=int(counts.sum()), points=len(colors_only))
+    return list(zip(colors, bold))
+
+
+def palette(pixels, n=DEFAULT_NUM_COLORS, min_v=DEFAULT_MINV, max_v=DEFAULT_MAXV,
+            bold_add=DEFAULT_BOLD_ADD, order_colors=True, randomness=False, accuracy=DEFAULT_ACCURACY,
+            thumb_size=THUMB_SIZE, resize_mode=DEFAULT_RESIZE_MODE, bin_bits=DEFAULT_BIN_BITS,
+            tolerance=DEFAULT_TOLERANCE, batch_size=0, batch_iter=DEFAULT_BATCH_ITER,
+            progress=None, stats=None, workers=0, restarts=1, quantizer=DEFAULT_QUANTIZER, warm=None):
+    """
+    Get the n most dominant colors of an (H, W, C) float pixel array.
     Clamps value to between min_v and max_v.
 
     Creates bold colors using bold_add.
@@ -169,18 +574,26 @@ def colorz(fd, n=DEFAULT_NUM_COLORS, min_v=DEFAULT_MINV, max_v=DEFAULT_MAXV,
 
     For terminal colors, the hue order is:
     red, yellow, green, cyan, blue, magenta
+
+    The image is downsampled to thumb_size with resize_mode first, or used
+    at full resolution if thumb_size is None. Colors are then binned with
+    bin_bits bits per channel. k-means stops after accuracy iterations or
+    once no center moves more than tolerance. A non-zero batch_size
+    switches to minibatch_kmeans with batch_iter iterations instead.
+    With workers > 1 or restarts > 1 the full k-means runs through
+    parallel.kmeans, keeping the best of restarts seeded runs.
+    quantizer picks one of QUANTIZERS; the one-pass engines ignore the
+    k-means settings. warm resumes the full k-means from an earlier run,
+    see cluster_palette.
+    progress is called with (iteration, max_iter) on every k-means pass.
+    Stage timings and counters are recorded into stats if one is given.
+
+    Does not touch bpy, so it is safe to run in a worker thread.
     """
-    size = fd.size
-    img = get_pixels(fd)
-    img = resize(img, size[0], size[1], 200, 200)
-
-    obs = get_colors(img)
-    colors_only = [color for color, count in obs]
-    counts = [count for color, count in obs]
-    clamped = [clamp(color, min_v, max_v) for color in colors_only]
-    clusters = kmeans(randomness, array(clamped).astype(float), counts, n, max_iter=accuracy)
-    colors = order_by_hue(clusters) if order_colors else clusters
-    return list(zip(colors, [brighten(c, bold_add) for c in colors]))
+    colors_only, counts = histogram(pixels, thumb_size, resize_mode, bin_bits, stats)
+    return cluster_palette(colors_only, counts, n, min_v, max_v, bold_add, order_colors, randomness,
+                           accuracy, tolerance, batch_size, batch_iter, progress, stats,
+                           workers, restarts, quantizer, warm)
 
 
 def html_preview(colors, font_size=DEFAULT_FONT_SIZE,
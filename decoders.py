@@ -0,0 +1,214 @@
+"""
+Dependency-free PNG and PPM/PGM decoders.
+
+Only zlib and NumPy are needed, so wallpapers in these formats can be
+read without bpy or Pillow. Both return an (H, W, 4) float32 array in
+the 0-1 range, top row first.
+
+Given a target size, the integer samples are box-reduced a stripe of
+rows at a time before the float conversion, so only the decompressed
+bytes and the reduced image are ever held.
+"""
+
+import re
+import zlib
+import struct
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+STRIPE_ROWS = 64
+
+
+def is_png(head):
+    return head.startswith(PNG_SIGNATURE)
+
+
+def is_ppm(head):
+    return head[:2] in (b'P2', b'P3', b'P5', b'P6')
+
+
+def reduce_factor(width, height, size):
+    """Largest integer downscale that keeps the image at least size."""
+    if not size:
+        return 1
+    return max(1, min(width // size[0], height // size[1]))
+
+
+def box_reduce(values, factor, maxval):
+    """
+    (H, W, C) integer samples averaged over factor x factor boxes, as 0-1
+    float32, converting STRIPE_ROWS output rows at a time.
+    """
+    if factor <= 1:
+        return values.astype(np.float32) / maxval
+    height, width, channels = values.shape[0] // factor, values.shape[1] // factor, values.shape[2]
+    out = np.empty((height, width, channels), dtype=np.float32)
+    for y in range(0, height, STRIPE_ROWS):
+        end = min(height, y + STRIPE_ROWS)
+        block = values[y * factor:end * factor, :width * factor]
+        out[y:end] = block.reshape(end - y, factor, width, factor, channels).mean(axis=(1, 3), dtype=np.float32)
+    out /= maxval
+    return out
+
+
+def to_rgba(values, channels):
+    """Expands (H, W, channels) 0-1 values to (H, W, 4)."""
+    h, w = values.shape[:2]
+    out = np.ones((h, w, 4), dtype=np.float32)
+    if channels in (1, 2):
+        out[..., :3] = values[..., :1]
+    else:
+        out[..., :3] = values[..., :3]
+    if channels in (2, 4):
+        out[..., 3] = values[..., -1]
+    return out
+
+
+def _unfilter_rows(ftypes, lines, bpp):
+    """None, Sub and Up only: each row is one vector operation."""
+    out = np.empty_like(lines)
+    prev = np.zeros(lines.shape[1], dtype=np.uint8)
+    for y, (ftype, line) in enumerate(zip(ftypes, lines)):
+        if ftype == 0:
+            out[y] = line
+        elif ftype == 1:
+            out[y] = np.cumsum(line.reshape(-1, bpp), axis=0, dtype=np.uint32).reshape(-1) & 0xff
+        else:
+            out[y] = line + prev
+        prev = out[y]
+    return out
+
+
+def _unfilter_wavefront(ftypes, lines, bpp):
+    """
+    Any filter mix. A pixel depends only on its left, upper and upper-left
+    neighbours, so each anti-diagonal is unfiltered as one vector
+    operation: height + width steps instead of a loop over every byte.
+    """
+    height, stride = lines.shape
+    width = stride // bpp
+    filtered = lines.reshape(-1, bpp)
+    # Pixels padded with a zero row above and a zero column to the left;
+    # along a diagonal consecutive pixels are width apart (width - 1 in
+    # the unpadded input).
+    row = width + 1
+    out = np.zeros(((height + 1) * row, bpp), dtype=np.uint8)
+    ftypes = ftypes.astype(np.int16)[:, None]
+    sub, up = np.isin(ftypes, (1, 3)), np.isin(ftypes, (2, 3))
+    halve, paeth_rows = (ftypes == 3).astype(np.int16), ftypes == 4
+    for d in range(height + width - 1):
+        lo, hi = max(0, d - width + 1), min(height, d + 1)
+        start = (lo + 1) * row + d - lo + 1
+        a = out[start - 1::width][:hi - lo].astype(np.int16)
+        b = out[start - row::width][:hi - lo].astype(np.int16)
+        c = out[start - row - 1::width][:hi - lo].astype(np.int16)
+        pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        pred = np.where(paeth_rows[lo:hi], paeth, (a * sub[lo:hi] + b * up[lo:hi]) >> halve[lo:hi])
+        raw = filtered[d + lo * (width - 1)::max(width - 1, 1)][:hi - lo]
+        out[start::width][:hi - lo] = (raw + pred) & 0xff
+    return out.reshape(height + 1, row, bpp)[1:, 1:].reshape(height, stride)
+
+
+def _unfilter(raw, height, stride, bpp):
+    """
+    Undoes PNG scanline filters.
+
+    Images using only None, Sub and Up are unfiltered row by row.
+    Average and Paeth depend on the byte to their left as well, so those
+    images are unfiltered a diagonal at a time (_unfilter_wavefront).
+    """
+    data = np.frombuffer(raw, dtype=np.uint8, count=height * (stride + 1)).reshape(height, stride + 1)
+    ftypes, lines = data[:, 0], data[:, 1:]
+    if ftypes.max(initial=0) > 4:
+        raise ValueError("Invalid PNG filter type %d" % ftypes.max())
+    if (ftypes >= 3).any():
+        return _unfilter_wavefront(ftypes, lines, bpp)
+    return _unfilter_rows(ftypes, lines, bpp)
+
+
+def decode_png(data, size=None):
+    if not is_png(data):
+        raise ValueError("Not a PNG file")
+    pos = len(PNG_SIGNATURE)
+    idat, palette, trns = [], None, None
+    while pos < len(data):
+        length, ctype = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if ctype == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+        elif ctype == b'PLTE':
+            palette = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, 3)
+        elif ctype == b'tRNS':
+            trns = chunk
+        elif ctype == b'IDAT':
+            idat.append(chunk)
+        elif ctype == b'IEND':
+            break
+    if interlace:
+        raise ValueError("Interlaced PNGs are not supported")
+
+    channels = PNG_CHANNELS[color_type]
+    stride = (width * channels * depth + 7) // 8
+    bpp = max(1, channels * depth // 8)
+    rows = _unfilter(zlib.decompress(b''.join(idat)), height, stride, bpp)
+
+    if depth == 16:
+        values = rows.view('>u2').reshape(height, width, channels)
+    elif depth == 8:
+        values = rows.reshape(height, width, channels)
+    else:
+        bits = np.unpackbits(rows, axis=1).reshape(height, -1, depth)
+        weights = 1 << np.arange(depth - 1, -1, -1)
+        values = (bits * weights).sum(axis=2)[:, :width, None]
+
+    factor = reduce_factor(width, height, size)
+    if color_type == 3:
+        rgba = np.full((len(palette), 4), 255, dtype=np.uint8)
+        rgba[:, :3] = palette
+        if trns:
+            rgba[:len(trns), 3] = np.frombuffer(trns, dtype=np.uint8)
+        return box_reduce(rgba[values[..., 0]], factor, 255)
+    return to_rgba(box_reduce(values, factor, (1 << depth) - 1), channels)
+
+
+def decode_ppm(data, size=None):
+    if not is_ppm(data):
+        raise ValueError("Not a PPM/PGM file")
+    magic = data[:2]
+    tokens = []
+    pos = 2
+    token = re.compile(rb'\s*(?:#[^\n]*\n\s*)*(\d+)')
+    while len(tokens) < 3:
+        match = token.match(data, pos)
+        if not match:
+            raise ValueError("Invalid PPM header")
+        tokens.append(int(match.group(1)))
+        pos = match.end()
+    width, height, maxval = tokens
+    channels = 3 if magic in (b'P3', b'P6') else 1
+
+    count = width * height * channels
+    if magic in (b'P5', b'P6'):
+        dtype = np.uint8 if maxval < 256 else np.dtype('>u2')
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=pos + 1)
+    else:
+        values = np.array(data[pos:].split()[:count], dtype=np.int64)
+    values = values.reshape(height, width, channels)
+    return to_rgba(box_reduce(values, reduce_factor(width, height, size), maxval), channels)
+
+
+def decode(path, size=None):
+    """
+    Decode a PNG or PPM/PGM file, reduced to no less than size if given,
+    raising ValueError for anything else.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_png(data):
+        return decode_png(data, size)
+    if is_ppm(data):
+        return decode_ppm(data, size)
+    raise ValueError("Unsupported image format: %s" % path)
@@ -0,0 +1,135 @@
+"""
+Frame sources for animated and video wallpapers.
+
+Frames are decoded one at a time and never more than MAX_FRAMES of them,
+evenly spread over the animation:
+
+    pillow  animated GIF, WebP and APNG, when Pillow is installed
+    ffmpeg  videos (and animations without Pillow) through the ffmpeg
+            and ffprobe executables, scaled down by ffmpeg itself
+
+histogram() bins every sampled frame and folds it into a running
+colorz.merge_histograms total, so memory stays at one frame plus the
+histogram however long the animation is. The total is averaged over the
+frames, so an animation counts as much as a still wallpaper.
+"""
+
+import os
+import json
+import shutil
+import subprocess
+
+import numpy as np
+
+try:
+    from . import colorz, images
+except ImportError:
+    import colorz, images
+
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mkv", ".mov", ".avi", ".m4v")
+ANIMATED_EXTENSIONS = (".gif", ".webp", ".png", ".apng")
+MAX_FRAMES = 24
+
+
+def pillow_animated(path):
+    if not path.lower().endswith(ANIMATED_EXTENSIONS) or not images.has_pillow():
+        return False
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "n_frames", 1) > 1
+    except OSError:
+        return False
+
+
+def backend(path):
+    """The frame source for path, or None if it is a still image."""
+    lower = path.lower()
+    if pillow_animated(path):
+        return "pillow"
+    if lower.endswith(VIDEO_EXTENSIONS) or lower.endswith(".gif"):
+        return "ffmpeg" if shutil.which("ffmpeg") and shutil.which("ffprobe") else None
+    return None
+
+
+def sample(count, max_frames):
+    """Indices of at most max_frames frames spread evenly over count."""
+    return np.unique(np.linspace(0, count - 1, min(count, max_frames)).astype(int))
+
+
+def pillow_frames(path, size=None, max_frames=MAX_FRAMES):
+    from PIL import Image
+    with Image.open(path) as img:
+        for i in sample(img.n_frames, max_frames):
+            img.seek(int(i))
+            frame = img.convert("RGBA")
+            factor = images.reduce_factor(*frame.size, size)
+            if factor > 1:
+                frame = frame.reduce(factor)
+            yield np.asarray(frame, dtype=np.float32) / 255.0
+
+
+def probe(path):
+    """Width, height and duration in seconds (or None) of the first video stream."""
+    out = images.sibling("wallpaper").run_tool([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:format=duration", "-of", "json", path
+    ])
+    info = json.loads(out)
+    stream = info["streams"][0]
+    try:
+        duration = float(info.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return stream["width"], stream["height"], duration
+
+
+def ffmpeg_frames(path, size=None, max_frames=MAX_FRAMES):
+    width, height, duration = probe(path)
+    factor = images.reduce_factor(width, height, size)
+    width, height = width // factor, height // factor
+    rate = max_frames / duration if duration else 1.0
+    proc = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", path,
+        "-vf", "fps=%f,scale=%d:%d:flags=area" % (rate, width, height),
+        "-frames:v", str(max_frames), "-f", "rawvideo", "-pix_fmt", "rgba", "-"
+    ], stdout=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    frame_bytes = width * height * 4
+    try:
+        while True:
+            data = proc.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4).astype(np.float32) / 255.0
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+FRAME_SOURCES = {
+    "pillow": pillow_frames,
+    "ffmpeg": ffmpeg_frames,
+}
+
+
+def histogram(path, source=None, stats=None, max_frames=MAX_FRAMES, **hist_args):
+    """
+    colorz.histogram of up to max_frames frames of path, merged as they
+    are decoded. Every sampled frame weighs the same, and the counts are
+    averaged over the frames so the animation weighs as much as one still
+    image when merged with other wallpapers.
+    """
+    source = source or backend(path)
+    total, count = None, 0
+    with images.timed(stats, "decode frames"):
+        for frame in FRAME_SOURCES[source](path, images.thumb_size(hist_args), max_frames):
+            hist = colorz.histogram(frame, **hist_args)
+            total = hist if total is None else colorz.merge_histograms([total, hist])
+            count += 1
+    if total is None:
+        raise ValueError("No frames decoded from %s" % os.path.basename(path))
+    if stats:
+        stats.info["frames"] = count
+    colors, counts = total
+    return colors, counts / count
@@ -0,0 +1,201 @@
+"""
+Image sources for palette extraction.
+
+Every backend turns a wallpaper path into an (H, W, 4) float32 array:
+
+    pillow   any format Pillow reads, when it is installed
+    bpy      Blender's own loader, only inside Blender
+    builtin  the dependency-free PNG/PPM decoders in decoders.py, for
+             headless use without Pillow
+
+Backends and their dependencies are imported on first use, so importing
+this module costs nothing at add-on registration.
+
+Loaders take the thumbnail size the pixels are headed for. Pillow
+decodes JPEGs at a reduced DCT scale and box-reduces other formats, and
+the builtin decoders box-reduce the integer samples before converting
+them, so the float array never holds more than a small multiple of the
+thumbnail. Blender has no reduced decode: bpy loads the full image and
+scales its datablock in place before the pixels are copied out. The bpy
+loader reuses a datablock already open for the path and removes the
+ones it created.
+
+Animated and video wallpapers are streamed frame by frame through
+frames.py instead, into one running histogram.
+
+palette_from_files builds one color histogram per wallpaper on a thread
+pool (decoding and NumPy release the GIL) and clusters the merged bins
+once, so several monitors cost about as much as one image.
+"""
+
+import os
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_ORDER = ("pillow", "bpy", "builtin")
+
+
+def sibling(name):
+    """Import another module of the add-on, inside or outside its package."""
+    if __package__:
+        return importlib.import_module("." + name, __package__)
+    return importlib.import_module(name)
+
+
+def timed(stats, name):
+    return sibling("profiling").timed(stats, name)
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def has_pillow():
+    return has_module("PIL")
+
+
+def builtin_supports(path):
+    decoders = sibling("decoders")
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+    except OSError:
+        return False
+    return decoders.is_png(head) or decoders.is_ppm(head)
+
+
+def reduce_factor(width, height, size):
+    return sibling("decoders").reduce_factor(width, height, size)
+
+
+def load_pillow(path, stats=None, size=None):
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as img:
+        with timed(stats, "image load"):
+            if size:
+                img.draft("RGB", size)
+            img = img.convert("RGBA")
+            factor = reduce_factor(*img.size, size)
+            if factor > 1:
+                img = img.reduce(factor)
+        with timed(stats, "pixel read"):
+            return np.asarray(img, dtype=np.float32) / 255.0
+
+
+def load_builtin(path, stats=None, size=None):
+    with timed(stats, "image load"):
+        return sibling("decoders").decode(path, size)
+
+
+def find_datablock(path):
+    """An image datablock already loaded from path, or None."""
+    import bpy
+    path = os.path.normcase(os.path.abspath(path))
+    for img in bpy.data.images:
+        if img.filepath and os.path.normcase(os.path.abspath(bpy.path.abspath(img.filepath))) == path:
+            return img
+    return None
+
+
+def load_bpy(path, stats=None, size=None):
+    import bpy
+    img = find_datablock(path)
+    owned = img is None
+    with timed(stats, "image load"):
+        if owned:
+            img = bpy.data.images.load(path)
+            factor = reduce_factor(*img.size, size)
+            if factor > 1:
+                img.scale(img.size[0] // factor, img.size[1] // factor)
+    try:
+        with timed(stats, "pixel read"):
+            return sibling("colorz").get_pixels(img)
+    finally:
+        if owned:
+            bpy.data.images.remove(img)
+
+
+BACKENDS = {
+    "pillow": (lambda path: has_pillow(), load_pillow),
+    "builtin": (builtin_supports, load_builtin),
+    "bpy": (lambda path: has_module("bpy"), load_bpy),
+}
+
+
+def pick_backend(path):
+    """Return the first backend able to read path, or None."""
+    for name in BACKEND_ORDER:
+        if BACKENDS[name][0](path):
+            return name
+    return None
+
+
+def needs_main_thread(backend):
+    """bpy may only be used from Blender's main thread and process."""
+    return backend == "bpy"
+
+
+def load_pixels(path, backend=None, stats=None, size=None):
+    """
+    Decode an image file into an (H, W, 4) float32 array, no smaller than
+    size if the backend can decode at reduced resolution.
+    """
+    backend = backend or pick_backend(path)
+    if backend is None:
+        raise ValueError("No image decoder available for %s" % path)
+    return BACKENDS[backend][1](path, stats, size)
+
+
+def thumb_size(kwargs):
+    """The thumbnail size colorz.palette will downsample to for kwargs."""
+    return kwargs.get("thumb_size", sibling("colorz").THUMB_SIZE)
+
+
+def is_animated(path):
+    return sibling("frames").backend(path) is not None
+
+
+def file_histogram(path, backend=None, stats=None, **hist_args):
+    """colorz.histogram of path, streamed over its frames if it is animated."""
+    if is_animated(path):
+        return sibling("frames").histogram(path, stats=stats, **hist_args)
+    pixels = load_pixels(path, backend, stats, thumb_size(hist_args))
+    return sibling("colorz").histogram(pixels, stats=stats, **hist_args)
+
+
+def palette_from_file(path, backend=None, stats=None, **kwargs):
+    """Decode path and run colorz.palette on it with kwargs."""
+    colorz = sibling("colorz")
+    hist_args = {k: kwargs.pop(k) for k in colorz.HISTOGRAM_ARGS if k in kwargs}
+    return colorz.cluster_palette(*file_histogram(path, backend, stats, **hist_args), stats=stats, **kwargs)
+
+
+def palette_from_files(paths, backend=None, stats=None, decode_threads=None, pixels=None, **kwargs):
+    """
+    One palette for several wallpapers: decode and bin each of paths on a
+    pool of decode_threads threads, then run colorz.cluster_palette on the
+    merged histogram with kwargs (workers included).
+
+    pixels maps paths to arrays already decoded by the caller, which is
+    how bpy-backed images are passed in from the main thread.
+    """
+    colorz = sibling("colorz")
+    if len(paths) == 1 and not pixels:
+        return palette_from_file(paths[0], backend, stats, **kwargs)
+    hist_args = {k: kwargs.pop(k) for k in colorz.HISTOGRAM_ARGS if k in kwargs}
+    pixels = pixels or {}
+
+    def build(path):
+        if path in pixels:
+            return colorz.histogram(pixels[path], **hist_args)
+        return file_histogram(path, backend, **hist_args)
+
+    with timed(stats, "histograms"):
+        with ThreadPoolExecutor(max_workers=decode_threads or min(len(paths), 8)) as pool:
+            histograms = list(pool.map(build, paths))
+        merged = colorz.merge_histograms(histograms)
+    if stats:
+        stats.info["wallpapers"] = len(paths)
+    return colorz.cluster_palette(*merged, stats=stats, **kwargs)
@@ -0,0 +1,54 @@
+"""
+Background palette extraction.
+
+Blender's Python API is not thread safe, so only the NumPy pixel
+snapshot is handed to the worker thread. The operator polls the job
+from the main thread and writes the theme once it is done.
+"""
+
+import threading
+import logging
+
+
+class Cancelled(Exception):
+    """Raised inside the worker when the job is cancelled."""
+
+
+class PaletteJob:
+    """Runs func(*args, progress=..., **kwargs) in a daemon thread."""
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.progress = (0, 0)
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def done(self):
+        return not self.thread.is_alive()
+
+    def report(self, step, total):
+        """Progress callback; aborts the worker once cancelled."""
+        if self.cancelled.is_set():
+            raise Cancelled()
+        self.progress = (step, total)
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args, progress=self.report, **self.kwargs)
+        except Cancelled:
+            pass
+        except Exception as e:
+            logging.error("Error extracting palette: %s", e)
+            self.error = e
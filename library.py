@@ -0,0 +1,259 @@
+"""
+Palette library for a wallpaper collection.
+
+A JSON index under the XDG cache directory holds, for every image in the
+library directories, its path, mtime, size and content hash, the base
+palette and the derived theme shades. Rebuilding only extracts new or
+changed files; a file whose hash is already known (a moved or renamed
+wallpaper) reuses its palette. Themes can then be applied by lookup,
+without reading pixels.
+
+similar() ranks the library by palette likeness: each palette becomes a
+vector of its colors in lightness order, the nearest vectors are found
+with one matrix product over the whole library and re-ranked by the
+symmetric closest-color distance between palettes.
+
+    python library.py build ~/Pictures/wallpapers
+    python library.py similar ~/Pictures/wallpapers/forest.jpg
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+from argparse import ArgumentParser
+
+import numpy as np
+
+if __package__:
+    from . import batch, theme
+    from .wallpaper import XDG_CACHE_DIR
+else:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import batch, theme
+    from wallpaper import XDG_CACHE_DIR
+
+LIBRARY_PATH = os.path.join(XDG_CACHE_DIR, "wal_theme", "library.json")
+LIBRARY_VERSION = 1
+RERANK = 4
+
+_loaded = {}
+_indexed = {}
+
+
+def file_hash(path):
+    """sha1 of the file contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def empty(options):
+    return {"version": LIBRARY_VERSION, "options": options, "entries": {}}
+
+
+def load(path=LIBRARY_PATH):
+    """The library index, re-read only when the file changed."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as f:
+            library = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error("Error reading palette library: %s", e)
+        return None
+    if library.get("version") != LIBRARY_VERSION:
+        return None
+    _loaded[path] = (mtime, library)
+    return library
+
+
+def save(library, path=LIBRARY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(library, f)
+    os.replace(tmp, path)
+
+
+def entry(stat, digest, raw_colors):
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": digest,
+        "palette": [[[int(c) for c in color], [int(c) for c in bold]] for color, bold in raw_colors],
+        "shades": theme.theme_colors(raw_colors, 1.0),
+    }
+
+
+def update(patterns, options, jobs=None, path=LIBRARY_PATH, progress=None):
+    """
+    Bring the library up to date with the images matched by patterns.
+
+    Entries are kept while a file's mtime and size are unchanged, copied
+    from a known content hash otherwise, and extracted with
+    batch.extract_all only when the contents are new. Changing options
+    rebuilds everything. Returns the library and the number of extracted
+    and failed images.
+    """
+    options = json.loads(json.dumps(options))
+    library = load(path)
+    if library is None or library["options"] != options:
+        library = empty(options)
+    old = library["entries"]
+    by_hash = {e["hash"]: e for e in old.values()}
+
+    entries, pending = {}, {}
+    paths = batch.find_images(patterns)
+    for i, image in enumerate(paths):
+        if progress:
+            progress(i, len(paths))
+        try:
+            stat = os.stat(image)
+            known = old.get(image)
+            if known and (known["mtime_ns"], known["size"]) == (stat.st_mtime_ns, stat.st_size):
+                entries[image] = known
+                continue
+            digest = file_hash(image)
+        except OSError as e:
+            logging.error("Error reading %s: %s", image, e)
+            continue
+        if digest in by_hash:
+            entries[image] = dict(by_hash[digest], mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        else:
+            pending[image] = (stat, digest)
+
+    failed = []
+
+    def add(image, get_palette):
+        try:
+            raw_colors = get_palette()
+        except Exception as e:
+            logging.error("Error indexing %s: %s", image, e)
+            failed.append(image)
+            return
+        entries[image] = entry(*pending[image], raw_colors)
+
+    batch.extract_all(list(pending), options, jobs, add)
+    library["entries"] = dict(sorted(entries.items()))
+    save(library, path)
+    return library, len(pending) - len(failed), len(failed)
+
+
+def lookup(image, options=None, path=LIBRARY_PATH):
+    """The indexed palette of image if it is unchanged (and built with options), else None."""
+    library = load(path)
+    if library is None:
+        return None
+    if options is not None and library["options"] != json.loads(json.dumps(options)):
+        return None
+    known = library["entries"].get(os.path.abspath(image))
+    try:
+        stat = os.stat(image)
+    except OSError:
+        return None
+    if not known or (known["mtime_ns"], known["size"]) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    return [(tuple(color), tuple(bold)) for color, bold in known["palette"]]
+
+
+def vector(palette):
+    """Palette colors sorted by lightness and flattened, as floats."""
+    colors = np.array([color for color, _ in palette], dtype=float)
+    return colors[np.argsort(colors.sum(axis=1), kind="stable")].reshape(-1)
+
+
+def palette_distance(a, b):
+    """Mean distance from each color to the closest color of the other palette, both ways."""
+    a = np.array([color for color, _ in a], dtype=float)
+    b = np.array([color for color, _ in b], dtype=float)
+    d = np.sqrt(((a[:, None] - b[None]) ** 2).sum(axis=2))
+    return float((d.min(axis=1).mean() + d.min(axis=0).mean()) / 2)
+
+
+def palette_index(path=LIBRARY_PATH):
+    """
+    Names, palettes, palette vectors and their squared norms of the
+    library, rebuilt only when the library is.
+    """
+    library = load(path)
+    if not library or not library["entries"]:
+        return None
+    cached = _indexed.get(path)
+    if cached and cached[0] is library:
+        return cached[1]
+    names = list(library["entries"])
+    palettes = [library["entries"][p]["palette"] for p in names]
+    if len({len(p) for p in palettes}) == 1:
+        vectors = np.array([vector(p) for p in palettes])
+        norms = (vectors ** 2).sum(axis=1)
+    else:
+        vectors = norms = None
+    _indexed[path] = (library, (names, palettes, vectors, norms))
+    return _indexed[path][1]
+
+
+def similar(palette, count=5, exclude=None, path=LIBRARY_PATH):
+    """The count library entries closest to palette, as (path, distance), nearest first."""
+    index = palette_index(path)
+    if index is None:
+        return []
+    names, palettes, vectors, norms = index
+    if vectors is None or vectors.shape[1] != 3 * len(palette):
+        candidates = range(len(names))
+    else:
+        d2 = norms - 2.0 * vectors @ vector(palette)
+        candidates = np.argsort(d2)[:count * RERANK + 1]
+    ranked = sorted((palette_distance(palette, palettes[i]), names[i]) for i in candidates
+                    if names[i] != exclude)
+    return [(name, distance) for distance, name in ranked[:count]]
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="index new and changed wallpapers")
+    build.add_argument('images', nargs='+',
+                       help="wallpaper directories or glob patterns")
+    build.add_argument('-j', '--jobs', type=int, default=None,
+                       help="worker processes. Default: one per CPU")
+
+    find = commands.add_parser("similar", help="list wallpapers with a similar palette")
+    find.add_argument('image',
+                      help="an indexed wallpaper")
+    find.add_argument('-n', '--count', type=int, default=5,
+                      help="how many to list. Default: 5")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    if args.command == "build":
+        library, extracted, failed = update(args.images, batch.DEFAULT_OPTIONS, args.jobs)
+        print(f"{len(library['entries'])} wallpapers indexed, {extracted} extracted, {failed} failed")
+        return 1 if failed else 0
+
+    image = os.path.abspath(os.path.expanduser(args.image))
+    palette = lookup(image)
+    if palette is None:
+        logging.error("%s is not in the library, run build first", image)
+        return 1
+    for name, distance in similar(palette, args.count, exclude=image):
+        print(f"{distance:6.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
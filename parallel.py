@@ -0,0 +1,163 @@
+"""
+Multiprocess k-means.
+
+The weighted points are copied once into a multiprocessing.shared_memory
+block that every worker maps, so tasks only carry the k centers in and
+per-cluster sums out. Two ways to use the extra cores:
+
+    chunked   each Lloyd iteration splits the points across the workers,
+              which return their cluster_sums for the parent to add up
+    restarts  every worker runs a whole differently seeded k-means and
+              the result with the lowest inertia wins
+
+The process pool is kept between runs. Worker functions are looked up by
+module name, so with the spawn start method (Windows, macOS) the add-on
+must be importable from the child; if the pool cannot be used the run
+falls back to colorz.kmeans in this process.
+"""
+
+import logging
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from . import colorz
+except ImportError:
+    import colorz
+
+# Below this many points per worker a chunked iteration spends more on
+# the pool round trip than it saves; the add-on's thumbnails stay under
+# it, so there the pool only runs restarts.
+MIN_CHUNK = 65536
+
+_pool = None
+_pool_workers = 0
+_attached = {}
+
+
+def share(array):
+    """Copy array into a new shared memory block; returns the block and a picklable descriptor."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach(desc):
+    """Worker side: map a shared block, keeping only the latest run's mapping open."""
+    name, shape, dtype = desc
+    if name not in _attached:
+        for old in list(_attached):
+            shm, array = _attached.pop(old)
+            del array
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+    return _attached[name][1]
+
+
+def chunk_sums(desc, start, stop, centers):
+    """Worker: cluster_sums of points[start:stop] for the given centers."""
+    data = attach(desc)[start:stop]
+    points, weights = data[:, :3], data[:, 3]
+    return colorz.cluster_sums(points, weights, colorz.assign(points, centers), len(centers))
+
+
+def restart(desc, seed, k, max_iter, tol):
+    """Worker: one seeded k-means over the shared points; returns its centers and inertia."""
+    data = attach(desc)
+    points, weights = data[:, :3], data[:, 3]
+    centers = colorz.kmeans(False, points, weights, k, max_iter, tol, seed=seed)
+    return centers, colorz.inertia(points, weights, np.array(centers))
+
+
+def get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown():
+    """Stop the worker processes, if any."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def reducer(pool, desc, n, chunks):
+    """A colorz.kmeans reduce function summing chunk_sums from the pool."""
+    bounds = np.linspace(0, n, chunks + 1).astype(int)
+
+    def reduce(centers):
+        parts = list(pool.map(chunk_sums, repeat(desc), bounds[:-1], bounds[1:], repeat(centers)))
+        return sum(s for s, _ in parts), sum(t for _, t in parts)
+    return reduce
+
+
+def best_of(results, stats):
+    centers, best = min(results, key=lambda r: r[1])
+    if stats:
+        stats.info.update(restarts=len(results), inertia=best)
+    return centers
+
+
+def kmeans(rand, points, weights, k, max_iter=100, tol=colorz.DEFAULT_TOLERANCE, workers=2, restarts=1,
+           progress=None, stats=None, init=None):
+    """
+    colorz.kmeans over up to workers processes.
+
+    With restarts > 1, that many seeded runs execute concurrently and the
+    lowest-inertia centers are returned; otherwise one run is chunked
+    across the workers. Starting centers in init rule out restarts.
+    Reproducible unless rand is set. When the pool is used, stats.info
+    records its number of processes.
+    """
+    if init is not None:
+        restarts = 1
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    seeds = np.random.SeedSequence(None if rand else 216).generate_state(restarts).tolist()
+    chunks = min(workers, -(-len(points) // MIN_CHUNK))
+
+    if workers <= 1 or (restarts <= 1 and chunks <= 1):
+        results = []
+        for i, seed in enumerate(seeds):
+            if progress:
+                progress(i, restarts)
+            centers = colorz.kmeans(rand, points, weights, k, max_iter, tol, seed=seed if restarts > 1 else None,
+                                    stats=stats, init=init)
+            results.append((centers, colorz.inertia(points, weights, np.array(centers))))
+        return best_of(results, stats)
+
+    shm, desc = share(np.column_stack([points, weights]))
+    futures = []
+    try:
+        pool = get_pool(workers)
+        if stats:
+            stats.info["processes"] = workers
+        if restarts <= 1:
+            return colorz.kmeans(rand, points, weights, k, max_iter, tol, progress, stats,
+                                 reduce=reducer(pool, desc, len(points), chunks), init=init)
+        futures = [pool.submit(restart, desc, seed, k, max_iter, tol) for seed in seeds]
+        results = []
+        for i, future in enumerate(futures):
+            if progress:
+                progress(i, restarts)
+            results.append(future.result())
+        return best_of(results, stats)
+    except (OSError, BrokenProcessPool) as e:
+        logging.error("Error running parallel k-means, clustering in-process: %s", e)
+        shutdown()
+        return colorz.kmeans(rand, points, weights, k, max_iter, tol, progress, stats, init=init)
+    finally:
+        for future in futures:
+            future.cancel()
+        shm.close()
+        shm.unlink()
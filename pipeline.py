@@ -0,0 +1,232 @@
+"""
+Theme generation stages shared by the operator and the wallpaper watcher.
+
+Each stage reads its settings from the scene's Wal properties and
+records its timing into a profiling.RunStats.
+
+Clustered palettes are memoized per cache key for the session, and the
+last one applied is kept so the shading properties (saturation, axis
+colors) can re-derive the theme from it without touching the image.
+"""
+
+import os
+import sys
+import bpy
+from . import wallpaper
+from . import colorz
+from . import images
+from . import cache
+from . import jobs
+from . import theme
+from . import profiling
+
+THEME_FILE = "Wal_Theme.xml"
+
+last_palette = None
+palettes = {}
+similar_wallpapers = []
+
+
+def find_wallpapers(all_monitors=True, blocking=True):
+    """The desktop's wallpapers, or only the first monitor's; see wallpaper.get_cached_wallpapers."""
+    paths = []
+    for image in wallpaper.get_cached_wallpapers(wallpaper.get_desktop_env(), blocking):
+        try:
+            image = os.path.expanduser(os.path.normpath(image.replace('$HOME', '~')))
+        except:
+            pass
+        paths.append(image)
+    return paths if all_monitors else paths[:1]
+
+
+def library_dir():
+    """The palette library directory from the add-on preferences, or ''."""
+    addon = bpy.context.preferences.addons.get(__package__)
+    return bpy.path.abspath(addon.preferences.library_dir) if addon and addon.preferences.library_dir else ""
+
+
+def palette_args(scene):
+    args = dict(n=6, bold_add=0, randomness=scene.rand_shift, accuracy=scene.acc_shift, tolerance=scene.tol_shift,
+                resize_mode=scene.resize_shift, bin_bits=scene.bits_shift, quantizer=scene.quantizer_shift)
+    if scene.quantizer_shift != 'KMEANS':
+        return args
+    if scene.minibatch_shift:
+        args.update(thumb_size=colorz.MINIBATCH_THUMB_SIZE, batch_size=scene.batch_shift,
+                    batch_iter=scene.batch_iter_shift)
+    else:
+        # The thumbnail is too small for chunked iterations to pay off, so
+        # worker processes only run restarts.
+        args.update(workers=scene.workers_shift if scene.restarts_shift > 1 else 0,
+                    restarts=scene.restarts_shift)
+    return args
+
+
+def result_args(scene):
+    """palette_args without the ones that do not change the palette."""
+    args = palette_args(scene)
+    args.pop("workers", None)
+    return args
+
+
+def lookup_palette(scene, stats, blocking=True):
+    """Returns the wallpaper paths, their cache key and the cached palette, if any."""
+    with stats.stage("wallpaper lookup"):
+        paths = find_wallpapers(scene.monitors_shift, blocking)
+    if not paths:
+        return None, None, None
+    params = result_args(scene)
+    # A warm-started result depends on the runs before it, so it never
+    # answers for a cold run of the same wallpaper.
+    warm = {"warm": True} if warm_enabled(scene) else {}
+    key = None if scene.rand_shift else cache.palette_key(
+        paths, min_v=colorz.DEFAULT_MINV, max_v=colorz.DEFAULT_MAXV, **params, **warm)
+    if key in palettes:
+        stats.info["cache"] = "memory"
+        return paths, key, palettes[key]
+    if len(paths) == 1 and library_dir():
+        raw_colors = images.sibling("library").lookup(paths[0], params)
+        if raw_colors is not None:
+            stats.info["cache"] = "library"
+            return paths, None, raw_colors
+    raw_colors = cache.load_palette(key) if key else None
+    stats.info["cache"] = "hit" if raw_colors is not None else "miss"
+    return paths, key, raw_colors
+
+
+def main_thread_pixels(paths, scene, stats):
+    """Decode the paths only bpy can read; only NumPy snapshots leave this thread."""
+    size = images.thumb_size(palette_args(scene))
+    return {path: images.load_pixels(path, "bpy", stats, size) for path in paths
+            if not images.is_animated(path) and images.needs_main_thread(images.pick_backend(path))}
+
+
+def warm_enabled(scene):
+    """Whether the scene's k-means resumes from warm start state."""
+    return (scene.warm_shift and not scene.rand_shift and scene.quantizer_shift == 'KMEANS'
+            and not scene.minibatch_shift)
+
+
+def warm_state(paths, scene):
+    """
+    The k-means warm start for paths: the state key to save the run under
+    and the state to resume, or (None, None) when warm starting is off.
+
+    The key leaves out accuracy, so raising it resumes the earlier run.
+    Wallpapers without state of their own are seeded from the last run.
+    """
+    if not warm_enabled(scene):
+        return None, None
+    args = palette_args(scene)
+    for name in ("accuracy", "workers", "restarts"):
+        args.pop(name, None)
+    key = cache.palette_key(paths, **args)
+    if key is None:
+        return None, None
+    state = cache.load_state(key)
+    if state is None:
+        last = cache.load_state(cache.LAST_STATE)
+        state = {"centers": last["centers"]} if last else {}
+    return key, state
+
+
+def run_extraction(paths, args, state_key, stats, pixels, progress=None):
+    """Extract the palette of paths with palette_args, persisting the warm start state."""
+    warm = args.get("warm")
+    raw_colors = stats.call(images.palette_from_files, paths, stats=stats, pixels=pixels,
+                            progress=progress, **args)
+    if warm:
+        cache.save_state(state_key, warm)
+        cache.save_state(cache.LAST_STATE, warm)
+    return raw_colors
+
+
+def extraction_args(paths, scene):
+    args = palette_args(scene)
+    state_key, warm = warm_state(paths, scene)
+    if warm is not None:
+        args["warm"] = warm
+    return args, state_key
+
+
+def extract(paths, scene, stats):
+    """Extract one palette for all of paths on the calling thread."""
+    return run_extraction(paths, *extraction_args(paths, scene), stats, main_thread_pixels(paths, scene, stats))
+
+
+def start_extraction(paths, scene, stats):
+    """Extract one palette for all of paths in a jobs.PaletteJob."""
+    return jobs.PaletteJob(run_extraction, paths, *extraction_args(paths, scene), stats,
+                           main_thread_pixels(paths, scene, stats)).start()
+
+
+def write_theme(raw_colors, scene, stats):
+    """Render the theme preset and return its path."""
+    with stats.stage("render"):
+        contents = theme.render(raw_colors, scene.axis_shift, scene.saturation_shift)
+    with stats.stage("write"):
+        theme_dir = bpy.utils.user_resource( 'SCRIPTS', path="presets/interface_theme", create=True)
+        path = os.path.join(theme_dir, THEME_FILE)
+        with open(path, "w") as templatefile:
+            templatefile.write(contents)
+    return path
+
+
+def resolve(root, steps, structs):
+    """Follow (property, index) steps from root, memoized in structs."""
+    if steps not in structs:
+        prop, index = steps[-1]
+        parent = resolve(root, steps[:-1], structs) if len(steps) > 1 else root
+        struct = getattr(parent, prop)
+        structs[steps] = struct if index is None else struct[index]
+    return structs[steps]
+
+
+def apply_theme(raw_colors, scene, stats):
+    """Assign the rendered theme, palette and literal values alike, to the active theme without a preset file."""
+    with stats.stage("apply"):
+        root = bpy.context.preferences.themes[0]
+        structs = {}
+        skipped = 0
+        for steps, attr, text in theme.property_values(raw_colors, scene.axis_shift, scene.saturation_shift):
+            try:
+                struct = resolve(root, steps, structs) if steps else root
+                setattr(struct, attr, theme.property_value(text, getattr(struct, attr)))
+            except (AttributeError, TypeError, IndexError, ValueError):
+                # Property missing or renamed in this Blender version.
+                skipped += 1
+    if skipped:
+        stats.info["skipped properties"] = skipped
+
+
+def finish(scene, key, raw_colors, stats):
+    """Cache the palette, apply it to the running theme and publish the run stats."""
+    global last_palette
+    if key:
+        cache.save_palette(key, raw_colors)
+        palettes[key] = raw_colors
+        if len(palettes) > cache.MAX_ENTRIES:
+            del palettes[next(iter(palettes))]
+    apply_theme(raw_colors, scene, stats)
+    last_palette = raw_colors
+    stats.finish()
+
+
+def build_library(scene):
+    """Index the library directory with the scene's settings; returns (entries, extracted, failed)."""
+    options = result_args(scene)
+    # Forked workers are safe here; spawned ones cannot import the add-on.
+    jobs = None if sys.platform.startswith("linux") else 1
+    index, extracted, failed = images.sibling("library").update([library_dir()], options, jobs)
+    return len(index["entries"]), extracted, failed
+
+
+def find_similar(count=5):
+    """Library wallpapers whose palette is closest to the last one applied."""
+    similar_wallpapers[:] = images.sibling("library").similar(last_palette, count) if last_palette else []
+    return similar_wallpapers
+
+
+def refresh(self, context):
+    """Update callback of the shading properties: re-apply the last palette."""
+    if last_palette is not None:
+        apply_theme(last_palette, context.scene, profiling.RunStats())
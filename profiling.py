@@ -0,0 +1,74 @@
+"""
+Lightweight run instrumentation.
+
+A RunStats records how long each stage of a theme run took plus a few
+counters (k-means iterations, convergence delta, point counts). The last
+run is kept in last_run for the Wal panel and logged when it finishes.
+"""
+
+import os
+import time
+import cProfile
+import logging
+from contextlib import contextmanager, nullcontext
+
+try:
+    from .wallpaper import XDG_CACHE_DIR
+except ImportError:
+    from wallpaper import XDG_CACHE_DIR
+
+PROFILE_DIR = os.path.join(XDG_CACHE_DIR, "wal_theme", "profiles")
+
+last_run = None
+
+
+def timed(stats, name):
+    """stats.stage(name), or a no-op when stats is None."""
+    return stats.stage(name) if stats else nullcontext()
+
+
+class RunStats:
+    def __init__(self, profile=False):
+        self.stages = []
+        self.info = {}
+        self.profile = profile
+        self.profile_path = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.stages)
+
+    def call(self, func, *args, **kwargs):
+        """Run func, under cProfile if profiling is enabled."""
+        if not self.profile:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profile_path = os.path.join(PROFILE_DIR, time.strftime("wal-%Y%m%d-%H%M%S.prof"))
+            profiler.dump_stats(self.profile_path)
+
+    def lines(self):
+        """Human readable breakdown, one line per stage or counter."""
+        out = ["%s: %.1f ms" % (name, seconds * 1000) for name, seconds in self.stages]
+        out += ["%s: %s" % (key, ("%.3g" % value) if isinstance(value, float) else value)
+                for key, value in self.info.items()]
+        return out
+
+    def finish(self):
+        """Publish as the last run and log the breakdown."""
+        global last_run
+        last_run = self
+        logging.info("Wal theme run took %.1f ms (%s)", self.total * 1000, ", ".join(self.lines()))
+        if self.profile_path:
+            logging.info("Wal theme profile written to %s", self.profile_path)
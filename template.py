@@ -0,0 +1,83 @@
+"""
+Compiled blendertemplate.xml.
+
+The template is split once into literal segments and placeholder slots
+(color11_, x-axis-color_, ...), so rendering a theme is a single join.
+It is recompiled only when the template file's mtime changes.
+
+property_index maps every attribute of the Theme element, placeholder or
+literal, to the theme RNA property it sets, so the whole theme can be
+assigned to the live preferences without XML.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+PLACEHOLDER = re.compile(r'(color\d+_|[xyz]-axis-color_|grid-color_)')
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "blendertemplate.xml")
+
+_compiled = {}
+_indexed = {}
+
+
+def compile_template(contents):
+    """Split a template into [literal, slot, literal, ..., literal]."""
+    return PLACEHOLDER.split(contents)
+
+
+def load(path=TEMPLATE_PATH):
+    """Return the compiled template at path, recompiling if it changed."""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _compiled.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as templatefile:
+        parts = compile_template(templatefile.read())
+    _compiled[path] = (mtime, parts)
+    return parts
+
+
+def index_struct(elem, steps, out):
+    """Collect the attributes of a struct element and its children."""
+    for attr, value in elem.attrib.items():
+        match = PLACEHOLDER.match(value)
+        if match:
+            out.append((steps, attr, match.group(1), value[match.end():]))
+        else:
+            out.append((steps, attr, None, value))
+    for prop in elem:
+        structs = list(prop)
+        if len(structs) == 1:
+            index_struct(structs[0], steps + ((prop.tag, None),), out)
+        else:
+            for i, struct in enumerate(structs):
+                index_struct(struct, steps + ((prop.tag, i),), out)
+
+
+def property_index(path=TEMPLATE_PATH):
+    """
+    Return (steps, attr, slot, literal) for every attribute in the Theme
+    element, reindexing if the template changed.
+
+    steps is a tuple of (property, collection index or None) leading from
+    the Theme struct to the one owning attr. slot is the placeholder the
+    value starts with, or None; literal is the rest of the value (a hex
+    alpha suffix after a slot, or the whole value).
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _indexed.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    entries = []
+    for struct in ET.parse(path).getroot().iter("Theme"):
+        index_struct(struct, (), entries)
+    _indexed[path] = (mtime, entries)
+    return entries
+
+
+def render(parts, values):
+    """Fill every slot of a compiled template from the values dict."""
+    out = list(parts)
+    out[1::2] = [values[slot] for slot in parts[1::2]]
+    return "".join(out)
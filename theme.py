@@ -0,0 +1,90 @@
+"""
+Theme colors derived from an extracted palette.
+
+Turns the (color, bold) pairs returned by colorz into the 30 hex colors
+used by blendertemplate.xml, then renders the theme document or lists the
+theme property values it sets. Nothing here needs bpy, so the batch CLI
+can share it with the add-on.
+"""
+
+import numpy as np
+
+try:
+    from . import colorspace, template, wallpaper
+except ImportError:
+    import colorspace, template, wallpaper
+
+DEFAULT_AXIS_COLORS = {
+    "x-axis-color_": "#ff3352",
+    "y-axis-color_": "#8bdc00",
+    "z-axis-color_": "#2890ff",
+    "grid-color_": "#545454",
+}
+
+
+def modulate(rgb, mod, sat):
+    """Shifts the lightness and saturation of an (N, 3) batch of 0-1 colors."""
+    hls = colorspace.rgb_to_hls(rgb)
+    hls[:, 1] = np.clip(hls[:, 1]*mod, 0.0, 1.0)
+    hls[:, 2] = np.clip(hls[:, 2]*sat*0.8/mod, 0.0, 1.0)
+    return [wallpaper.rgb_to_hex(c) for c in (colorspace.hls_to_rgb(hls)*255).astype(int).tolist()]
+
+
+def theme_colors(raw_colors, saturation):
+    """Returns the 30 hex colors: black, the palette, and three derived shade rows."""
+    colors =["#000000"] + [wallpaper.rgb_to_hex([*color[0]]) for color in raw_colors]
+    while len(colors)<30:
+        colors.append("#000000")
+
+    base = np.array([wallpaper.hex_to_rgb(c) for c in colors[1:8]])/255.0
+    colors[9:16] = modulate(base, .6, saturation)
+    colors[16:23] = modulate(base, 1.25, saturation)
+    colors[23:30] = modulate(base, .4, saturation)
+    return colors
+
+
+def theme_values(colors, axis_change):
+    """Maps every template placeholder to its hex color."""
+    values = {f"color{i}_": colors[i] for i in range(0, 26)}
+    if axis_change:
+        values.update({
+            "x-axis-color_": colors[20],
+            "y-axis-color_": colors[21],
+            "z-axis-color_": colors[18],
+            "grid-color_": colors[19],
+        })
+    else:
+        values.update(DEFAULT_AXIS_COLORS)
+    return values
+
+
+def render(raw_colors, axis_change=True, saturation=1.0, path=template.TEMPLATE_PATH):
+    """Renders the theme XML for a palette."""
+    values = theme_values(theme_colors(raw_colors, saturation), axis_change)
+    return template.render(template.load(path), values)
+
+
+def hex_to_float(value, alpha=""):
+    """'#rrggbb' plus an optional 'aa' suffix as 0-1 floats."""
+    value = value.lstrip("#") + alpha
+    return tuple(int(value[i:i + 2], 16) / 255.0 for i in range(0, len(value), 2))
+
+
+def property_value(text, current):
+    """Converts an XML attribute value to the type of the property's current value."""
+    if isinstance(current, bool):
+        return text == "TRUE"
+    if isinstance(current, int):
+        return int(text)
+    if isinstance(current, float):
+        return float(text)
+    if isinstance(current, str):
+        return text
+    return (hex_to_float(text) + (1.0,))[:len(current)]
+
+
+def property_values(raw_colors, axis_change=True, saturation=1.0, path=template.TEMPLATE_PATH):
+    """Yields (steps, attr, value) for every theme property, value as the rendered XML has it."""
+    values = theme_values(theme_colors(raw_colors, saturation), axis_change)
+    for steps, attr, slot, literal in template.property_index(path):
+        yield steps, attr, values[slot] + literal if slot else literal
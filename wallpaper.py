@@ -3,8 +3,9 @@ import subprocess
 import os
 import re
 import platform
-import colorsys
 import logging
+import threading
+import time
 
 HOME = os.getenv("HOME", os.getenv("USERPROFILE"))
 XDG_CACHE_DIR = os.getenv("XDG_CACHE_HOME", os.path.join(HOME, ".cache"))
@@ -14,14 +15,24 @@ MODULE_DIR = os.path.dirname(__file__)
 
 OS = platform.uname()[0]
 
+KDE_CONFIG = os.path.expanduser("~/.config/plasma-org.kde.plasma.desktop-appletsrc")
+HYPRPAPER_CONFIG = os.path.expanduser("~/.config/hypr/hyprpaper.conf")
+WALLPAPER_TTL = 10.0
+
+_wallpaper_cache = {}
+_missing_tools = set()
+_refreshing = set()
+_cache_lock = threading.Lock()
+
 def saturate_color(color, amount):
     """Saturate a hex color."""
-    r, g, b = hex_to_rgb(color)
-    r, g, b = [x / 255.0 for x in (r, g, b)]
-    h, l, s = colorsys.rgb_to_hls(r, g, b)
-    s = amount
-    r, g, b = colorsys.hls_to_rgb(h, l, s)
-    r, g, b = [x * 255.0 for x in (r, g, b)]
+    try:
+        from . import colorspace
+    except ImportError:
+        import colorspace
+    hls = colorspace.rgb_to_hls([x / 255.0 for x in hex_to_rgb(color)])
+    hls[2] = amount
+    r, g, b = colorspace.hls_to_rgb(hls) * 255.0
 
     return rgb_to_hex((int(r), int(g), int(b)))
 
@@ -61,7 +72,103 @@ def get_desktop_env():
 
     return None
 
+def run_tool(args):
+    """check_output, remembering tools that are not installed."""
+    if args[0] in _missing_tools:
+        raise FileNotFoundError("%s is not installed" % args[0])
+    try:
+        return subprocess.check_output(args, text=True)
+    except FileNotFoundError:
+        _missing_tools.add(args[0])
+        raise
+
+
+def config_file(desktop):
+    """The config file the wallpaper is read from, for file-based desktops."""
+    desktop = str(desktop).lower()
+    if "kde" in desktop:
+        return KDE_CONFIG
+    if "hyprland" in desktop:
+        return HYPRPAPER_CONFIG
+    return None
+
+
+def get_cached_wallpapers(desktop, blocking=True):
+    """
+    Memoized get_desktop_wallpapers.
+
+    File-based desktops are re-read when their config file's mtime
+    changes, the others at most every WALLPAPER_TTL seconds. Unless
+    blocking, an outdated entry is refreshed by prefetch_wallpaper in the
+    background and the memoized paths (or none yet) are returned at once,
+    so timers on Blender's UI thread never wait on gsettings or osascript.
+    """
+    conf = config_file(desktop)
+    try:
+        stamp = os.stat(conf).st_mtime_ns if conf else None
+    except OSError:
+        stamp = None
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _wallpaper_cache.get(desktop)
+    if entry and (entry[0] == stamp if conf else now < entry[1]):
+        return entry[2]
+    if not blocking:
+        prefetch_wallpaper(desktop)
+        return entry[2] if entry else []
+    paths = get_desktop_wallpapers(desktop)
+    with _cache_lock:
+        _wallpaper_cache[desktop] = (stamp, now + WALLPAPER_TTL, paths)
+    return paths
+
+
+def prefetch_wallpaper(desktop=None):
+    """Resolve the wallpapers in a background thread to warm the cache, one thread per desktop at a time."""
+    desktop = desktop or get_desktop_env()
+    with _cache_lock:
+        if desktop in _refreshing:
+            return None
+        _refreshing.add(desktop)
+
+    def refresh():
+        try:
+            get_cached_wallpapers(desktop)
+        finally:
+            with _cache_lock:
+                _refreshing.discard(desktop)
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def unique(paths):
+    """Drop empty and repeated paths, keeping the first occurrence."""
+    return list(dict.fromkeys(p for p in paths if p))
+
+
+def xfce_wallpapers():
+    """
+    The last image of every XFCE monitor, from workspace 0. Xfconf keeps
+    the old monitorN/image-path keys after xfdesktop moves to named
+    monitors, so those are only read when there are no last-image keys.
+    """
+    props = run_tool(["xfconf-query", "-c", "xfce4-desktop", "-l"]).split()
+    last = [p for p in props if re.fullmatch(r"/backdrop/screen\d+/monitor[^/]+/workspace0/last-image", p)]
+    props = last or [p for p in props if re.fullmatch(r"/backdrop/screen\d+/monitor[^/]+/image-path", p)]
+    if not props:
+        props = ["/backdrop/screen0/monitor0/image-path"]
+    return [run_tool(["xfconf-query", "-c", "xfce4-desktop", "-p", p]).strip() for p in props]
+
+
 def get_desktop_wallpaper(desktop):
+    """The wallpaper of the first monitor, or None."""
+    paths = get_desktop_wallpapers(desktop)
+    return paths[0] if paths else None
+
+
+def get_desktop_wallpapers(desktop):
+    """Every configured wallpaper, one per monitor where the desktop allows it."""
     try:
         desktop = str(desktop).lower()
     except:
@@ -69,58 +176,52 @@ def get_desktop_wallpaper(desktop):
 
     try:
         if "gnome" in desktop or "unity" in desktop or "cinnamon" in desktop:
-            out = subprocess.check_output([
+            out = run_tool([
                 "gsettings", "get",
                 "org.gnome.desktop.background", "picture-uri"
-            ], text=True).strip()
-            return out.strip("'").removeprefix("file://")
+            ]).strip()
+            return unique([out.strip("'").removeprefix("file://")])
 
         elif "mate" in desktop:
-            out = subprocess.check_output([
+            out = run_tool([
                 "gsettings", "get", "org.mate.background", "picture-filename"
-            ], text=True).strip()
-            return out.strip("'")
+            ]).strip()
+            return unique([out.strip("'")])
 
         elif "xfce" in desktop:
-            out = subprocess.check_output([
-                "xfconf-query", "-c", "xfce4-desktop",
-                "-p", "/backdrop/screen0/monitor0/image-path"
-            ], text=True).strip()
-            return out
+            return unique(xfce_wallpapers())
 
         elif "kde" in desktop:
-            with open(os.path.expanduser("~/.config/plasma-org.kde.plasma.desktop-appletsrc")) as f:
+            with open(KDE_CONFIG) as f:
                 contents = f.read()
-            match = re.search(r'Image=(.*)', contents)
-            if match:
-                return match.group(1)
+            return unique(m.strip().removeprefix("file://")
+                          for m in re.findall(r'^Image=(.*)$', contents, re.MULTILINE))
         
         elif "hyprland" in desktop:
-            if os.path.exists(os.path.expanduser("~/.config/hypr/hyprpaper.conf")):
-                with open(os.path.expanduser("~/.config/hypr/hyprpaper.conf")) as f:
+            if os.path.exists(HYPRPAPER_CONFIG):
+                with open(HYPRPAPER_CONFIG) as f:
                     contents = f.read()
-                match = re.search(r'wallpaper\s*=\s*(.*)', contents)
-                if match:
-                    out = match.group(1).strip()
-                    if ',' in out:
-                        return out.split(',')[-1].strip()
-                    return out
-            return None
+                # "wallpaper = monitor,path", the monitor may be empty
+                return unique(m.split(',')[-1].strip()
+                              for m in re.findall(r'^\s*wallpaper\s*=\s*(.*)$', contents, re.MULTILINE))
+            return []
         
         elif "darwin" in OS.lower() :
-            out = subprocess.check_output([
-                "osascript", "-e",
-                'tell application "Finder" to get POSIX path of (desktop picture as alias)'
-            ], text=True).strip()
-            return out
+            out = run_tool([
+                "osascript",
+                "-e", 'tell application "System Events" to set pics to picture of every desktop',
+                "-e", "set AppleScript's text item delimiters to linefeed",
+                "-e", "return pics as text"
+            ])
+            return unique(line.strip() for line in out.splitlines())
 
         elif "windows" in OS.lower():
             import winreg
             with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Control Panel\Desktop") as key:
                 value, _ = winreg.QueryValueEx(key, "WallPaper")
-                return value
+                return unique([value])
 
     except Exception as e:
         logging.error("Error retrieving wallpaper: %s", e)
 
-    return None
+    return []
@@ -0,0 +1,103 @@
+"""
+Wallpaper watcher.
+
+While a scene's watch_shift is on, a bpy.app.timers poll compares the
+desktop wallpapers' paths and mtimes every WATCH_INTERVAL seconds. When it
+changes the palette is re-extracted in the background (or read from the
+palette cache) and applied to the live theme.
+An unchanged desktop costs a cached path lookup and one stat per wallpaper;
+outdated paths are re-resolved in a background thread, never in the timer.
+"""
+
+import os
+import logging
+import bpy
+from bpy.app.handlers import persistent
+from . import pipeline
+from . import profiling
+
+WATCH_INTERVAL = 2.0
+JOB_INTERVAL = 0.25
+
+state = {"stamp": None, "job": None, "key": None, "stats": None}
+
+
+def wallpaper_stamp(scene):
+    stamp = []
+    for image in pipeline.find_wallpapers(scene.monitors_shift, blocking=False):
+        try:
+            stamp.append((image, os.stat(image).st_mtime_ns))
+        except OSError:
+            stamp.append((image, None))
+    return tuple(stamp)
+
+
+def poll(scene):
+    job = state["job"]
+    if job:
+        if not job.done:
+            return JOB_INTERVAL
+        state["job"] = None
+        if job.result is not None:
+            pipeline.finish(scene, state["key"], job.result, state["stats"])
+        return WATCH_INTERVAL
+
+    stamp = wallpaper_stamp(scene)
+    if not stamp or stamp == state["stamp"]:
+        return WATCH_INTERVAL
+    state["stamp"] = stamp
+
+    stats = profiling.RunStats()
+    paths, key, raw_colors = pipeline.lookup_palette(scene, stats, blocking=False)
+    if not paths:
+        return WATCH_INTERVAL
+    if raw_colors is not None:
+        pipeline.finish(scene, None, raw_colors, stats)
+        return WATCH_INTERVAL
+    state.update(job=pipeline.start_extraction(paths, scene, stats), key=key, stats=stats)
+    return JOB_INTERVAL
+
+
+def tick():
+    scene = bpy.context.scene
+    if scene is None or not scene.watch_shift:
+        reset()
+        return None
+    try:
+        return poll(scene)
+    except Exception as e:
+        logging.error("Error watching wallpaper: %s", e)
+        return WATCH_INTERVAL
+
+
+def reset():
+    if state["job"]:
+        state["job"].cancel()
+    state.update(stamp=None, job=None, key=None, stats=None)
+
+
+def start():
+    if not bpy.app.timers.is_registered(tick):
+        bpy.app.timers.register(tick, first_interval=0.0, persistent=True)
+
+
+def stop():
+    if bpy.app.timers.is_registered(tick):
+        bpy.app.timers.unregister(tick)
+    reset()
+
+
+def toggle(self, context):
+    """Update callback of Scene.watch_shift."""
+    if context.scene.watch_shift:
+        start()
+    else:
+        stop()
+
+
+@persistent
+def on_load(dummy):
+    """Resume watching when a file saved with watch mode on is opened."""
+    scene = bpy.context.scene
+    if scene is not None and scene.watch_shift:
+        start()